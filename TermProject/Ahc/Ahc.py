@@ -1,17 +1,27 @@
-import datetime
-import queue
+import asyncio
+import copy
 from enum import Enum
-from threading import Thread, Lock
+import itertools
+import random
+import threading
+import time
+import traceback
+from threading import Lock
 
 import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
+from scipy.sparse.csgraph import shortest_path
+
+from Ahc.Executors import ThreadExecutor, run_coroutine, STOPQUEUE, QueuePolicies
+from Ahc.Metrics import ComponentMetrics, print_metrics
+from Ahc.Clocks import LogicalClock, currentcomponent
 
 # TIMING ASSUMPTIONS
 # TODO: Event handling time, message sending time, assumptions about clock (drift, skew, ...)
 # TODO: 1. Asynch,  2. Synch 3. Partial-synch 4. Timed asynch
 # TODO: Causal-order (happen before), total-order,
 # TODO: Causal-order algebra!!!
-# TODO: Implement logical clocks (Lamport clocks, vector clocks) in event handling loop
 
 #  AUTOMATA and EXECUTIONS
 # TODO: Let component model hande executions and chekcs on executions (which event, in which order, per process or per system, similarity of executions)
@@ -24,6 +34,14 @@ import networkx as nx
 # TODO: Given a graph as input, generate the topology....
 
 inf = float('inf')
+NOPATH = -1  # next hop in the forwarding table when there is no path
+
+# Returns the smallest integer type that can hold the node ids of a topology with n nodes
+def compact_dtype(n):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
 
 # The following are the common default events for all components.
 class EventTypes(Enum):
@@ -32,6 +50,12 @@ class EventTypes(Enum):
     MFRT = "msgfromtop"
     MFRP = "msgfrompeer"
 
+# Used by the prioritized queues, the smaller value is handled first
+class EventPriorities(Enum):
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
 class MessageDestinationIdentifiers(Enum):
     LINKLAYERBROADCAST = -1,  # sinngle-hop broadcast, means all directly connected nodes
     NETWORKLAYERBROADCAST = -2  # For flooding over multiple-hops means all connected nodes to me over one or more links
@@ -50,32 +74,118 @@ class ConnectorTypes(Enum):
     UP = "UP"
     PEER = "PEER"
 
+# Events, headers and messages are allocated for every hop, they are slotted to avoid a __dict__ per instance.
+# Subclasses that add attributes should declare them in their own __slots__
 class GenericMessagePayload:
+    __slots__ = ('messagepayload',)
+
     def __init__(self, messagepayload):
         self.messagepayload = messagepayload
 
 class GenericMessageHeader:
-    def __init__(self, messagetype, messagefrom, messageto, nexthop=float('inf'), interfaceid=float('inf'), sequencenumber=-1):
+    __slots__ = ('messagetype', 'messagefrom', 'messageto', 'nexthop', 'interfaceid', 'sequencenumber', 'priority')
+
+    def __init__(self, messagetype, messagefrom, messageto, nexthop=float('inf'), interfaceid=float('inf'),
+                 sequencenumber=-1, priority=EventPriorities.NORMAL):
         self.messagetype = messagetype
         self.messagefrom = messagefrom
         self.messageto = messageto
         self.nexthop = nexthop
         self.interfaceid = interfaceid
         self.sequencenumber = sequencenumber
+        self.priority = priority
 
 class GenericMessage:
+    __slots__ = ('header', 'payload')
+
     def __init__(self, header, payload):
         self.header = header
         self.payload = payload
-        self.uniqueid = str(header.messagefrom) + "-" + str(header.sequencenumber)
 
+    # Only built when it is read, e.g. by the duplicate detection of broadcasting
+    @property
+    def uniqueid(self):
+        return f"{self.header.messagefrom}-{self.header.sequencenumber}"
+
+# The size of the payload of a message, only for payloads that know their size without serialization
+def message_size(eventcontent):
+    payload = getattr(getattr(eventcontent, "payload", None), "messagepayload", eventcontent)
+    if payload is None:
+        return 0
+    if hasattr(payload, "nbytes"):
+        return payload.nbytes
+    if isinstance(payload, (bytes, bytearray, str)):
+        return len(payload)
+    if isinstance(payload, (list, tuple)):
+        return sum(getattr(item, "nbytes", 0) for item in payload)
+    return 0
+
+# The messages that a channel coalesced on their way over a link, in the order they were sent. The component that a
+# batch is delivered to gets its messages as consecutive events, see ComponentModel.dispatch_events
+class MessageBatch:
+    __slots__ = ('messages', 'nbytes', 'priority')
+
+    def __init__(self):
+        self.messages = []
+        self.nbytes = 0
+        self.priority = EventPriorities.LOW
+
+    def add(self, message, priority):
+        self.messages.append(message)
+        self.nbytes += message_size(message)
+        if priority.value < self.priority.value:
+            self.priority = priority
+
+# An event can be forwarded as it is by the components that do not change it, e.g. pass-through layers.
+# The priority of an event that carries a message is the priority of its header unless it is given.
+# The clock of an event is the stamp of the logical clock of the component that created it, see Ahc.Clocks. Its origin
+# identifies it by the component that created it and the number of events that component created before.
+# The queue wait of an event is measured from enqueued, the time it was put into the queue of the component that
+# handles it, see ComponentModel.trigger_event
 class Event:
-    def __init__(self, eventsource, event, eventcontent, fromchannel=None):
+    __slots__ = ('eventsource', 'event', 'time', 'enqueued', 'eventcontent', 'fromchannel', 'priority', 'clock',
+                 'origin')
+
+    def __init__(self, eventsource, event, eventcontent, fromchannel=None, priority=None):
         self.eventsource = eventsource
         self.event = event
-        self.time = datetime.datetime.now()
+        self.time = time.monotonic_ns()  # integer nanoseconds of the monotonic clock
+        self.enqueued = self.time
         self.eventcontent = eventcontent
         self.fromchannel = fromchannel
+        if priority is None:
+            if isinstance(eventcontent, GenericMessage):
+                priority = eventcontent.header.priority
+            else:
+                priority = EventPriorities.NORMAL
+        self.priority = priority
+        component = currentcomponent.get()  # set while a component with a clock or an event log handles events
+        if component is None:
+            self.clock = None
+            self.origin = None
+        else:
+            self.clock = None if component.clock is None else component.clock.send()
+            self.origin = component.originate()
+
+    # A copy of the event that is stamped when it is put, an event may be put more than once, e.g. when it is forwarded
+    # by a pass-through layer or a component sends it to itself again
+    def restamped(self):
+        eventobj = copy.copy(self)
+        eventobj.enqueued = time.monotonic_ns()
+        return eventobj
+
+    # Whether the event delivers a MessageBatch from a channel, the channel passes the batch through its stages as is
+    def is_batch(self):
+        return self.event == EventTypes.MFRB and type(self.eventcontent) is MessageBatch
+
+    # An event per message of the MessageBatch of this event that is the same otherwise
+    def unpack(self):
+        eventobjs = []
+        for message in self.eventcontent.messages:
+            eventobj = copy.copy(self)
+            eventobj.eventcontent = message
+            eventobjs.append(eventobj)
+        return eventobjs
 
 def singleton(cls):
     instance = [None]
@@ -87,9 +197,102 @@ def singleton(cls):
 
     return wrapper
 
-@singleton
+# A simulation context owns the component registry, the topology and the executor of one simulation, so that
+# independent simulations can run in the same process concurrently or one after the other.
+# ComponentRegistry() and Topology() return the instances of the current context: the innermost context entered with a
+# with statement in the calling thread, the context of the executor in its worker threads, or the default context.
+class SimulationContext:
+    tracer = None  # set by Tracer.attach
+    metricsenabled = False  # set by ComponentRegistry.enable_metrics
+    clocksenabled = False  # set by ComponentRegistry.enable_clocks
+    eventlog = None  # set by EventLog.attach
+    coalescing = False  # set by Channel.close_batch, the components only look for batches once a channel made one
+
+    # With a seed the random generators of the context and its components are reproducible
+    def __init__(self, executor=None, seed=None):
+        self.executor = None
+        self.seed = seed
+        self.random = random.Random(seed)
+        if executor is not None:
+            self.set_executor(executor)
+        self.registry = ComponentRegistry.__wrapped__(self)
+        self.topology = Topology.__wrapped__(self)
+
+    # The executor has to be set before the components are instantiated, the components get their queues from it
+    def set_executor(self, executor):
+        executor.context = self
+        self.executor = executor
+
+    def get_executor(self):
+        if self.executor is None:
+            self.set_executor(ThreadExecutor())
+        return self.executor
+
+    # A generator of its own for every component, so that the numbers a component draws do not depend on how the
+    # handlers of the components interleave
+    def create_random(self, name):
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f"{self.seed}/{name}")
+
+    # Makes this the current context of the calling thread for good, used by the worker threads of the executors
+    def activate(self):
+        try:
+            simulationcontexts.stack.append(self)
+        except AttributeError:
+            simulationcontexts.stack = [self]
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        simulationcontexts.stack.pop()
+
+    def terminate(self, drain=False, timeout=None):
+        return self.registry.terminate(drain, timeout)
+
+    def wait_until_quiescent(self, timeout=None):
+        return self.registry.wait_until_quiescent(timeout)
+
+    async def wait_until_quiescent_async(self, timeout=None):
+        return await self.registry.wait_until_quiescent_async(timeout)
+
+simulationcontexts = threading.local()
+defaultcontext = [None]
+defaultcontextlock = Lock()
+
+def current_context():
+    stack = getattr(simulationcontexts, 'stack', None)
+    if stack:
+        return stack[-1]
+    with defaultcontextlock:
+        if defaultcontext[0] is None:
+            defaultcontext[0] = SimulationContext()
+        return defaultcontext[0]
+
+# Like singleton, but there is one instance per simulation context, kept in the given attribute of the context
+def contextual(attribute):
+    def decorator(cls):
+        def wrapper():
+            return getattr(current_context(), attribute)
+
+        wrapper.__wrapped__ = cls
+        return wrapper
+
+    return decorator
+
+@contextual("registry")
 class ComponentRegistry:
-    components = {}
+    def __init__(self, context):
+        self.context = context
+        self.components = {}
+
+    def set_executor(self, executor):
+        self.context.set_executor(executor)
+
+    def get_executor(self):
+        return self.context.get_executor()
 
     def get_component_by_instance(self, instance):
         list_of_keys = list()
@@ -103,11 +306,80 @@ class ComponentRegistry:
         key = component.componentname + str(component.componentinstancenumber)
         self.components[key] = component
 
+    def remove_component(self, component):
+        key = component.componentname + str(component.componentinstancenumber)
+        self.components.pop(key, None)
+
     def get_component_by_key(self, componentname, componentinstancenumber):
         key = componentname + str(componentinstancenumber)
         return self.components[key]
 
+    # Stops all components and the executor, with drain the events that are already queued are handled first. The
+    # processes of a sharded topology are stopped as well. Returns True if all workers stopped within the timeout
+    def terminate(self, drain=False, timeout=None):
+        for cmp in list(self.components.values()):
+            cmp.terminate(drain)
+        stopped = self.get_executor().shutdown(timeout)
+        if self.context.topology.shards is not None:
+            stopped = self.context.topology.shards.stop(timeout) and stopped
+        return stopped
+
+    # Returns when no event is queued, delayed or being handled, i.e. the protocols of the simulation have finished,
+    # in all shards of a sharded topology. Returns False if the timeout expires first
+    def wait_until_quiescent(self, timeout=None):
+        if self.context.topology.shards is not None:
+            return self.context.topology.shards.wait_until_quiescent(timeout)
+        return self.get_executor().wait_until_quiescent(timeout)
+
+    async def wait_until_quiescent_async(self, timeout=None):
+        return await self.get_executor().wait_until_quiescent_async(timeout)
+
+    # Resolves the connectors of every component into the trigger_event callables of their targets. The components that
+    # are connected to nothing are reported and returned
+    def compile_routes(self):
+        unconnected = []
+        for cmp in self.components.values():
+            cmp.compile_routes()
+            if not cmp.connectors:
+                unconnected.append(cmp)
+                print(f"Component {cmp.componentname}.{cmp.componentinstancenumber} is not connected to any component")
+        return unconnected
+
+    # Enables the metrics of the components of the context and the ones that are created later
+    def enable_metrics(self, enabled=True):
+        self.context.metricsenabled = enabled
+        for cmp in self.components.values():
+            if not enabled:
+                cmp.metrics = None
+            elif cmp.metrics is None:
+                cmp.metrics = ComponentMetrics(cmp)
+
+    # Returns the metrics of every component by its key, empty if the metrics are not enabled
+    def get_metrics(self):
+        return {key: cmp.metrics.snapshot() for key, cmp in list(self.components.items()) if cmp.metrics is not None}
+
+    def reset_metrics(self):
+        for cmp in list(self.components.values()):
+            if cmp.metrics is not None:
+                cmp.metrics.reset()
+
+    def print_metrics(self, limit=None):
+        print_metrics(self.get_metrics(), limit)
+
+    # Gives the components that are created afterwards logical clocks, it has to be called before the topology is
+    # constructed to order all events
+    def enable_clocks(self):
+        self.context.clocksenabled = True
+        for key, cmp in self.components.items():
+            if cmp.clock is None:
+                cmp.clock = LogicalClock(key)
+
+    # The number of events on the longest causal chain so far, i.e. the largest Lamport clock
+    def critical_path_length(self):
+        return max((cmp.clock.lamport for cmp in list(self.components.values()) if cmp.clock is not None), default=0)
+
     def init(self):
+        self.compile_routes()
         for itemkey in self.components:
             cmp = self.components[itemkey]
             cmp.inputqueue.put_nowait(Event(self, EventTypes.INIT, None))
@@ -121,10 +393,30 @@ class ComponentRegistry:
                 for p in connectedcmp:
                     print(f"\t{i} {p.componentname}.{p.componentinstancenumber}")
 
-registry = ComponentRegistry()
-
 class ComponentModel:
     terminated = False
+    batchsize = 1  # the maximum number of pending events a worker takes from a queue of the component at once
+    queuecapacity = 0  # the default capacity of the queues of the component, 0 is unbounded
+    queuepolicy = QueuePolicies.BLOCK
+    prioritized = False  # whether the queues of the component are ordered by the priorities of the events
+    agingwindow = 64
+    failedevents = 0  # the events whose handlers raised an exception
+    tracer = None
+    metrics = None
+    clock = None
+    eventlog = None
+    # A pass-through component only forwards the messages from top down and from bottom up unchanged, its
+    # trigger_event is fused with the forwarding so that the messages skip its queue
+    passthrough = False
+    # The targets of send_down, send_up and send_peer, resolved from the connectors by compile_routes
+    downroutes = ()
+    uproutes = ()
+    peerroutes = ()
+    # The attributes that are set up when the component is constructed and connected, they are not saved in checkpoints
+    transientattributes = frozenset({'eventhandlers', 'batchhandlers', 'componentname', 'componentinstancenumber',
+                                     'num_worker_threads', 'connectors', 'registry', 'context', 'executor',
+                                     'createdevents', 'recordlock', 'tracer', 'metrics', 'clock', 'eventlog', 'queues',
+                                     'inputqueue', 'trigger_event', 'downroutes', 'uproutes', 'peerroutes'})
 
     def on_init(self, eventobj: Event):
         # print(f"Initializing {self.componentname}.{self.componentinstancenumber}")
@@ -142,9 +434,10 @@ class ComponentModel:
     def __init__(self, componentname, componentinstancenumber, num_worker_threads=1):
         self.eventhandlers = {EventTypes.INIT: self.on_init, EventTypes.MFRB: self.on_message_from_bottom,
                               EventTypes.MFRT: self.on_message_from_top, EventTypes.MFRP: self.on_message_from_peer}
+        # Optional handlers that take a list of consecutive events of the same type, e.g. to vectorize their processing
+        self.batchhandlers = {}
         # Add default handlers to all instantiated components.
         # If a component overwrites the __init__ method it has to call the super().__init__ method
-        self.inputqueue = queue.Queue()
         self.componentname = componentname
         self.componentinstancenumber = componentinstancenumber
         self.num_worker_threads = num_worker_threads
@@ -156,11 +449,40 @@ class ComponentModel:
 
         self.registry = ComponentRegistry()
         self.registry.add_component(self)
-
-        for i in range(self.num_worker_threads):
-            t = Thread(target=self.queue_handler, args=[self.inputqueue])
-            t.daemon = True
-            t.start()
+        self.context = self.registry.context
+        self.executor = self.context.get_executor()
+        self.random = self.context.create_random(componentname + str(componentinstancenumber))
+        self.createdevents = itertools.count()
+        self.recordlock = threading.RLock()
+        if self.context.tracer is not None:
+            self.tracer = self.context.tracer
+        if self.context.metricsenabled:
+            self.metrics = ComponentMetrics(self)
+        if self.context.clocksenabled:
+            self.clock = LogicalClock(self.componentname + str(self.componentinstancenumber))
+        if self.context.eventlog is not None:
+            self.eventlog = self.context.eventlog
+
+        self.queues = []
+        self.inputqueue = self.create_queue()
+        if self.passthrough:
+            self.trigger_event = self.forward_event
+
+    # The state of the component that is saved in checkpoints, see Ahc.Checkpoint. Components that hold objects which
+    # cannot be pickled override get_state and set_state
+    def get_state(self):
+        return {name: value for name, value in vars(self).items() if name not in self.transientattributes}
+
+    def set_state(self, state):
+        vars(self).update(state)
+
+    # Returns a new event queue of this component that is served by the executor
+    def create_queue(self, capacity=None, policy=None, prioritized=None):
+        myqueue = self.executor.create_queue(self, self.prioritized if prioritized is None else prioritized)
+        myqueue.capacity = self.queuecapacity if capacity is None else capacity
+        myqueue.policy = self.queuepolicy if policy is None else policy
+        self.queues.append(myqueue)
+        return myqueue
 
     def connect_me_to_component(self, name, component):
         try:
@@ -168,6 +490,7 @@ class ComponentModel:
         except AttributeError:
             self.connectors = ConnectorList()
             self.connectors[name] = component
+        self.compile_routes()
 
     def connect_me_to_channel(self, name, channel):
         try:
@@ -177,53 +500,199 @@ class ComponentModel:
             self.connectors[name] = channel
         connectornameforchannel = self.componentname + str(self.componentinstancenumber)
         channel.connect_me_to_component(connectornameforchannel, self)
+        self.compile_routes()
+
+    def disconnect_me_from_component(self, name, component):
+        connected = self.connectors[name]
+        connected.remove(component)
+        if not connected:
+            del self.connectors[name]
+        self.compile_routes()
+
+    def disconnect_me_from_channel(self, name, channel):
+        self.disconnect_me_from_component(name, channel)
+        connectornameforchannel = self.componentname + str(self.componentinstancenumber)
+        channel.disconnect_me_from_component(connectornameforchannel, self)
 
-    def terminate(self):
+    # Stops the queues of the component, the pending events are handled first if drain is True, else discarded
+    def terminate(self, drain=False):
         self.terminated = True
+        for myqueue in self.queues:
+            self.executor.stop_queue(myqueue, drain)
+
+    # Called whenever the connectors change and for all components by ComponentRegistry.init, i.e. after the
+    # pass-through components have fused their trigger_event
+    def compile_routes(self):
+        self.downroutes = tuple(p.trigger_event for p in self.connectors.get(ConnectorTypes.DOWN, ()))
+        self.uproutes = tuple(p.trigger_event for p in self.connectors.get(ConnectorTypes.UP, ()))
+        self.peerroutes = tuple(p.trigger_event for p in self.connectors.get(ConnectorTypes.PEER, ()))
 
     def send_down(self, event: Event):
-        try:
-            for p in self.connectors[ConnectorTypes.DOWN]:
-                p.trigger_event(event)
-        except:
-            pass
+        for trigger in self.downroutes:
+            trigger(event)
 
     def send_up(self, event: Event):
-        try:
-            for p in self.connectors[ConnectorTypes.UP]:
-                p.trigger_event(event)
-        except:
-            pass
+        for trigger in self.uproutes:
+            trigger(event)
 
     def send_peer(self, event: Event):
-        try:
-            for p in self.connectors[ConnectorTypes.PEER]:
-                p.trigger_event(event)
-        except:
-            pass
+        for trigger in self.peerroutes:
+            trigger(event)
 
     def send_self(self, event: Event):
         self.trigger_event(event)
 
     # noinspection PyArgumentList
-    def queue_handler(self, myqueue):
-        while not self.terminated:
-            workitem = myqueue.get()
-            if workitem.event in self.eventhandlers:
-                self.eventhandlers[workitem.event](eventobj=workitem)  # call the handler
+    # Returns the result of the handler, which is a coroutine if the handler is defined with async def
+    def handle_event(self, workitem: Event):
+        if workitem.event in self.eventhandlers:
+            try:
+                return self.guard(self.eventhandlers[workitem.event](eventobj=workitem), 1)  # call the handler
+            except Exception:
+                self.handler_failed(1)
+        else:
+            print(f"Event Handler: {workitem.event} is not implemented")
+
+    def handle_batch(self, workitems):
+        try:
+            return self.guard(self.batchhandlers[workitems[0].event](eventobjs=workitems), len(workitems))
+        except Exception:
+            self.handler_failed(len(workitems))
+
+    # An exception of a handler is printed and its events are counted in failedevents, the other events of the batch
+    # are handled. The exception of a coroutine handler is caught where it is awaited
+    def guard(self, result, count):
+        if asyncio.iscoroutine(result):
+            return self.guarded(result, count)
+        return result
+
+    async def guarded(self, coroutine, count):
+        try:
+            return await coroutine
+        except Exception:
+            self.handler_failed(count)
+
+    # Called in the except clause
+    def handler_failed(self, count):
+        self.failedevents += count
+        traceback.print_exc()
+
+    # Handles the events in order, a run of consecutive events of the same type is given to its batch handler at once.
+    # Yields the results of the handlers
+    def handle_events(self, workitems):
+        if self.eventlog is not None:
+            yield from self.record_events(workitems)
+            return
+        if self.clock is None:
+            yield from self.dispatch_events(workitems)
+            return
+        token = currentcomponent.set(self)  # the events created by the handlers get their clocks and origins
+        try:
+            yield from self.dispatch_events(workitems)
+        finally:
+            currentcomponent.reset(token)
+
+    # The handlers of a recorded component do not overlap, so that it draws its random numbers and creates its events
+    # in the order of its records. The lock excludes the worker threads, the tasks of the asyncio executor share the
+    # loop thread and are excluded by the executor, the lock is reentrant so that they do not block the loop
+    def record_events(self, workitems):
+        with self.recordlock:
+            self.eventlog.record(self, workitems)
+            token = currentcomponent.set(self)
+            try:
+                yield from self.dispatch_events(workitems)
+            finally:
+                currentcomponent.reset(token)
+
+    def originate(self):
+        return self.componentname + str(self.componentinstancenumber), next(self.createdevents)
+
+    def dispatch_events(self, workitems):
+        if self.context.coalescing and any(workitem.is_batch() for workitem in workitems):
+            workitems = [eventobj for workitem in workitems
+                         for eventobj in (workitem.unpack() if workitem.is_batch() else (workitem,))]
+        i = 0
+        while i < len(workitems):
+            event = workitems[i].event
+            if event in self.batchhandlers:
+                j = i + 1
+                while j < len(workitems) and workitems[j].event == event:
+                    j += 1
+                if self.clock is not None:
+                    self.clock.receive([workitem.clock for workitem in workitems[i:j]])
+                start = time.monotonic_ns()
+                yield self.handle_batch(workitems[i:j])
+                duration = time.monotonic_ns() - start
+                if self.tracer is not None:
+                    for workitem in workitems[i:j]:
+                        self.tracer.handled(self, workitem, start, duration // (j - i))
+                if self.metrics is not None:
+                    self.metrics.handled(workitems[i:j], start, duration)
+                i = j
+            elif self.tracer is None and self.metrics is None and self.clock is None:
+                yield self.handle_event(workitems[i])
+                i += 1
             else:
-                print(f"Event Handler: {workitem.event} is not implemented")
-            myqueue.task_done()
+                if self.clock is not None:
+                    self.clock.receive((workitems[i].clock,))
+                start = time.monotonic_ns()
+                yield self.handle_event(workitems[i])
+                duration = time.monotonic_ns() - start
+                if self.tracer is not None:
+                    self.tracer.handled(self, workitems[i], start, duration)
+                if self.metrics is not None:
+                    self.metrics.handled(workitems[i:i + 1], start, duration)
+                i += 1
 
+    def queue_handler(self, myqueue):
+        while True:
+            workitems = myqueue.get_batch(self.batchsize)
+            if workitems[0] is STOPQUEUE:
+                myqueue.task_done()
+                break
+            for result in self.handle_events(workitems):
+                run_coroutine(result)
+            myqueue.task_done_batch(len(workitems))
+            self.executor.event_done(len(workitems))
+
+    # The events are only stamped for the tracer and the metrics
     def trigger_event(self, eventobj: Event):
+        if self.tracer is not None or self.metrics is not None:
+            eventobj = eventobj.restamped()
+            if self.tracer is not None:
+                self.tracer.trigger(self, eventobj)
         self.inputqueue.put_nowait(eventobj)
 
-@singleton
-class Topology:
-    nodes = {}
-    channels = {}
+    # Forwards the messages in the thread of the sender, the other events are queued
+    def forward_event(self, eventobj: Event):
+        if eventobj.event == EventTypes.MFRT:
+            self.send_down(eventobj)
+        elif eventobj.event == EventTypes.MFRB:
+            self.send_up(eventobj)
+        else:
+            self.inputqueue.put_nowait(eventobj)
 
-    def construct_from_graph(self, G: nx.Graph, nodetype, channeltype):
+class TopologyError(Exception):
+    pass
+
+@contextual("topology")
+class Topology:
+    adjacency = None  # set by compute_forwarding_table in start
+    shards = None
+
+    def __init__(self, context):
+        self.context = context
+        self.nodes = {}
+        self.channels = {}
+
+    # With numshards > 1 the nodes are partitioned over that many processes that are launched by start,
+    # the nodes then live in the shard processes and not in this topology
+    def construct_from_graph(self, G: nx.Graph, nodetype, channeltype, numshards=1, executortype=None):
+        if numshards > 1:
+            from Ahc.Sharding import ShardedSimulation  # Ahc.Sharding builds on this module
+            self.G = G
+            self.shards = ShardedSimulation(G, nodetype, channeltype, numshards, executortype, self.context.seed)
+            return
         self.G = G
         nodes = list(G.nodes)
         edges = list(G.edges)
@@ -236,6 +705,46 @@ class Topology:
             self.nodes[k[0]].connect_me_to_channel(ConnectorTypes.DOWN, ch)
             self.nodes[k[1]].connect_me_to_channel(ConnectorTypes.DOWN, ch)
 
+    # The nodes of the graph share one broadcast medium, e.g. a FIFOBroadcastPerfectChannel, instead of a channel per
+    # edge, a broadcast then passes through one channel. The medium is a single collision domain where every node hears
+    # every other, so the topology is the complete graph over the nodes of G whatever its edges are
+    def construct_broadcast_medium(self, G: nx.Graph, nodetype, channeltype):
+        self.G = nx.complete_graph(G.nodes, create_using=type(G))
+        self.G.add_nodes_from(G.nodes(data=True))
+        nx.set_edge_attributes(self.G, 1, 'weight')
+        ch = channeltype(channeltype.__name__, "medium")
+        self.channels["medium"] = ch
+        for i in G.nodes:
+            self.nodes[i] = nodetype(nodetype.__name__, i)
+            self.nodes[i].connect_me_to_channel(ConnectorTypes.DOWN, ch)
+
+    # Adds a link between two existing nodes at runtime, only the affected rows of the forwarding table are updated
+    def add_edge(self, u, v, channeltype, weight=1):
+        if self.G.has_edge(u, v):
+            raise TopologyError(f"There is already a link between {u} and {v}")
+        ch = channeltype(channeltype.__name__, str(u) + "-" + str(v), weight)
+        self.channels[(u, v)] = ch
+        self.nodes[u].connect_me_to_channel(ConnectorTypes.DOWN, ch)
+        self.nodes[v].connect_me_to_channel(ConnectorTypes.DOWN, ch)
+        self.G.add_edge(u, v, weight=weight)
+        self.update_forwarding_table(u, v, inserted=True)
+        return ch
+
+    # Removes a link at runtime, its channel is disconnected from the nodes and terminated
+    def remove_edge(self, u, v):
+        if (u, v) not in self.channels and (self.G.is_directed() or (v, u) not in self.channels):
+            raise TopologyError(f"There is no link between {u} and {v}")
+        if (u, v) not in self.channels:
+            u, v = v, u
+        ch = self.channels.pop((u, v))
+        self.nodes[u].disconnect_me_from_channel(ConnectorTypes.DOWN, ch)
+        self.nodes[v].disconnect_me_from_channel(ConnectorTypes.DOWN, ch)
+        ch.terminate()
+        self.context.registry.remove_component(ch)
+        self.G.remove_edge(u, v)
+        self.update_forwarding_table(u, v, inserted=False)
+        return ch
+
     def construct_single_node(self, nodetype, instancenumber):
         self.singlenode = nodetype(nodetype.__name__, instancenumber)
         self.G = nx.Graph()
@@ -264,42 +773,161 @@ class Topology:
         for i in range(nodecnt):
             print(path[myid][i])
 
-    def start(self):
+    # With lazyforwardingtable the rows of the forwarding table are computed on the first route from a source,
+    # e.g. when only a few nodes use AllSeingEyeNetworkLayer
+    def start(self, lazyforwardingtable=False):
+        if self.shards is not None:
+            self.shards.start()
+            return
         # registry.printComponents()
         N = len(self.G.nodes)
-        self.compute_forwarding_table()
+        self.compute_forwarding_table(lazyforwardingtable)
         self.nodecolors = ['b'] * N
-        self.nodepos = nx.drawing.spring_layout(self.G)
+        self.nodepos = None  # computed on the first plot, the layout is too expensive for large topologies
         self.lock = Lock()
-        ComponentRegistry().init()
+        self.context.registry.init()
 
-    def compute_forwarding_table(self):
+    # Starts from a checkpoint instead of initializing the components, the topology has to be constructed as the one
+    # the checkpoint was saved from
+    def resume(self, path, lazyforwardingtable=False):
+        from Ahc.Checkpoint import load_checkpoint  # Ahc.Checkpoint builds on this module
         N = len(self.G.nodes)
-        self.ForwardingTable = [[0 for i in range(N)] for j in range(N)]
-        path = dict(nx.all_pairs_shortest_path(self.G))
-        # print(f"There are {N} nodes")
-        for i in range(N):
-            for j in range(N):
-                try:
-                    mypath = path[i][j]
-                    # print(f"{i}to{j} path = {path[i][j]} nexthop = {path[i][j][1]}")
-                    self.ForwardingTable[i][j] = path[i][j][1]
-                except KeyError:
-                    # print(f"{i}to{j}path = NONE")
-                    self.ForwardingTable[i][j] = inf  # No paths
-                except IndexError:
-                    # print(f"{i}to{j} nexthop = NONE")
-                    self.ForwardingTable[i][j] = i  # There is a path but length = 1 (self)
+        self.compute_forwarding_table(lazyforwardingtable)
+        self.nodecolors = ['b'] * N
+        self.nodepos = None
+        self.lock = Lock()
+        self.context.registry.compile_routes()
+        load_checkpoint(path, self.context)
+
+    def adjacency_matrix(self):
+        return nx.to_scipy_sparse_array(self.G, nodelist=range(len(self.G.nodes)), weight=None, format='csr')
+
+    # The forwarding table is an N x N numpy array of next hop ids, NOPATH when there is no path.
+    # The hop counts that find the rows that change with a link are kept in the same form, they are computed when a
+    # link changes for the first time so a static topology holds only the table
+    def compute_forwarding_table(self, lazy=False):
+        N = len(self.G.nodes)
+        self.adjacency = self.adjacency_matrix()
+        self.forwardingdtype = compact_dtype(N)
+        self.forwardingrows = {}
+        self.distancerows = {}
+        self.distances = None
+        if lazy:
+            self.ForwardingTable = None
+            return
+        self.ForwardingTable = np.empty((N, N), dtype=self.forwardingdtype)
+        # The predecessor of i in the shortest path tree of the reversed graph rooted at j is the next hop from i to j.
+        # The trees are computed for blocks of destinations to bound the memory of the float distance matrix
+        reversedadjacency = self.adjacency.T.tocsr()
+        blocksize = max(1, 2 ** 22 // N)
+        for first in range(0, N, blocksize):
+            destinations = np.arange(first, min(first + blocksize, N))
+            distances, predecessors = shortest_path(reversedadjacency, directed=True, unweighted=True,
+                                                    indices=destinations, return_predecessors=True)
+            predecessors[predecessors < 0] = NOPATH
+            predecessors[np.arange(len(destinations)), destinations] = destinations  # There is a path but length = 1 (self)
+            self.ForwardingTable[:, first:first + len(destinations)] = predecessors.T
+
+    # The hop counts between all pairs of nodes of the graph of the current adjacency matrix, in blocks of sources
+    def distance_matrix(self):
+        if self.distances is None:
+            N = self.adjacency.shape[0]
+            self.distances = np.empty((N, N), dtype=self.forwardingdtype)
+            blocksize = max(1, 2 ** 22 // N)
+            for first in range(0, N, blocksize):
+                sources = np.arange(first, min(first + blocksize, N))
+                distances = shortest_path(self.adjacency, directed=True, unweighted=True, indices=sources)
+                distances[np.isinf(distances)] = NOPATH
+                self.distances[first:first + len(sources)] = distances
+        return self.distances
+
+    # Computes the next hops and hop counts from the sources to all nodes with a breadth first search per source
+    def compute_forwarding_rows(self, sources):
+        N = self.adjacency.shape[0]
+        sources = np.asarray(sources)
+        distances, predecessors = shortest_path(self.adjacency, directed=True, unweighted=True, indices=sources,
+                                                return_predecessors=True)
+        # The next hop to a node is the child of the source on its path, that is found by pointer jumping on the
+        # predecessors where the children of the source, the source and the unreachable nodes point to themselves
+        nodes = np.broadcast_to(np.arange(N), predecessors.shape)
+        unreachable = predecessors < 0
+        nexthops = np.where((predecessors == sources[:, None]) | unreachable, nodes, predecessors)
+        while True:
+            jumped = np.take_along_axis(nexthops, nexthops, axis=1)
+            if np.array_equal(jumped, nexthops):
+                break
+            nexthops = jumped
+        nexthops[unreachable] = NOPATH
+        nexthops[np.arange(len(sources)), sources] = sources
+        distances[np.isinf(distances)] = NOPATH
+        return nexthops.astype(self.forwardingdtype), distances.astype(self.forwardingdtype)
+
+    def get_forwarding_row(self, source):
+        if self.ForwardingTable is not None:
+            return self.ForwardingTable[source]
+        try:
+            return self.forwardingrows[source]
+        except KeyError:
+            nexthops, distances = self.compute_forwarding_rows([source])
+            self.distancerows[source] = distances[0]
+            self.forwardingrows[source] = nexthops[0]
+            return nexthops[0]
+
+    # A shortest path from a source uses the link u->v only if d(s, u) + 1 == d(s, v), and the link shortens a path
+    # only if d(s, u) + 1 < d(s, v). Only the rows of these sources are searched again.
+    def update_forwarding_table(self, u, v, inserted):
+        if self.adjacency is None:
+            return  # not started yet, start computes the table of the current graph
+        N = len(self.G.nodes)
+        if self.ForwardingTable is not None:
+            self.distance_matrix()  # the hop counts of the graph before the change
+        self.adjacency = self.adjacency_matrix()
+        if self.ForwardingTable is not None:
+            sources = np.arange(N)
+            distances = self.distances
+        else:
+            sources = np.fromiter(self.distancerows.keys(), dtype=np.int64, count=len(self.distancerows))
+            if len(sources) == 0:
+                return
+            distances = np.stack([self.distancerows[source] for source in sources])
+
+        def uses_link(a, b):
+            da = distances[:, a].astype(np.int64)
+            db = distances[:, b].astype(np.int64)
+            da[da == NOPATH] = N + 1
+            db[db == NOPATH] = N + 1
+            if inserted:
+                return da + 1 < db
+            return da + 1 == db
+
+        affected = uses_link(u, v)
+        if not self.G.is_directed():
+            affected |= uses_link(v, u)
+        sources = sources[affected]
+        if len(sources) == 0:
+            return
+        nexthops, distances = self.compute_forwarding_rows(sources)
+        if self.ForwardingTable is not None:
+            self.ForwardingTable[sources] = nexthops
+            self.distances[sources] = distances
+        else:
+            for i, source in enumerate(sources):
+                self.forwardingrows[int(source)] = nexthops[i]
+                self.distancerows[int(source)] = distances[i]
 
     # all-seeing eye routing table contruction
     def print_forwarding_table(self):
-        registry.print_components()
-        print('\n'.join([''.join(['{:4}'.format(item) for item in row])
-                         for row in self.ForwardingTable]))
+        self.context.registry.print_components()
+        N = len(self.G.nodes)
+        print('\n'.join([''.join(['{:4}'.format(item if item != NOPATH else inf) for item in self.get_forwarding_row(i)])
+                         for i in range(N)]))
 
     # returns the all-seeing eye routing based next hop id
     def get_next_hop(self, fromId, toId):
-        return self.ForwardingTable[fromId][toId]
+        nexthop = self.get_forwarding_row(fromId)[toId]
+        if nexthop == NOPATH:
+            return inf  # No paths
+        return int(nexthop)
 
     # Returns the list of neighbors of a node
     def get_neighbors(self, nodeId):
@@ -319,6 +947,8 @@ class Topology:
 
     def plot(self):
         #self.lock.acquire()
+        if self.nodepos is None:
+            self.nodepos = nx.drawing.spring_layout(self.G)
         nx.draw(self.G, self.nodepos, node_color=self.nodecolors, with_labels=True, font_weight='bold')
         plt.draw()
         print(self.nodecolors)
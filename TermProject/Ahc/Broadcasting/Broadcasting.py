@@ -1,5 +1,3 @@
-import random
-import time
 from enum import Enum
 
 from Ahc.Ahc import ComponentModel, Event, GenericMessageHeader, GenericMessagePayload, GenericMessage, Topology, \
@@ -7,6 +5,7 @@ from Ahc.Ahc import ComponentModel, Event, GenericMessageHeader, GenericMessageP
 
 class BroadcastingEventTypes(Enum):
   BROADCAST = "broadcast"
+  REFLOOD = "reflood"
 
 # define your own message types
 class BroadcastingMessageTypes(Enum):
@@ -65,12 +64,16 @@ class ControlledFlooding(ComponentModel):
           # Send to higher layers
           self.update_topology()
           self.send_up(Event(self, EventTypes.MFRB, payload))
-          # Also continue flooding once
-          time.sleep(random.randint(1, 3))
-          self.senddownbroadcast(eventobj, eventobj.eventcontent.header.messagefrom,
-                                 eventobj.eventcontent.header.sequencenumber)
+          # Also continue flooding once, after a delay that does not hold the thread of the component
+          self.inputqueue.put_later(Event(self, BroadcastingEventTypes.REFLOOD, eventobj), self.random.randint(1, 3))
+
+  def on_reflood(self, eventobj: Event):
+    received = eventobj.eventcontent
+    self.senddownbroadcast(received, received.eventcontent.header.messagefrom,
+                           received.eventcontent.header.sequencenumber)
 
   def __init__(self, componentname, componentinstancenumber):
     super().__init__(componentname, componentinstancenumber)
     self.eventhandlers[BroadcastingEventTypes.BROADCAST] = self.on_broadcast
+    self.eventhandlers[BroadcastingEventTypes.REFLOOD] = self.on_reflood
     # add events here
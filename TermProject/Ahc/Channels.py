@@ -1,10 +1,12 @@
-import queue
-import random
+from collections import deque
 from enum import Enum
-from threading import Thread
+from threading import Condition, Lock
+
+import numpy as np
 
 from Ahc.Ahc import ComponentModel, EventTypes, ConnectorList, MessageDestinationIdentifiers
-from Ahc.Ahc import Event
+from Ahc.Ahc import Event, MessageBatch, message_size
+from Ahc.Executors import QueuePolicies, inf
 
 # TODO: Channel failure models: lossy-link, fair-loss, stubborn links, perfect links (WHAT ELSE?), FIFO perfect
 # TODO: Logged perfect links (tolerance to crashes), authenticated perfect links
@@ -20,12 +22,41 @@ from Ahc.Ahc import Event
 # Channels deliver the message to output queue by the "delivertocomponent" event
 # The output queue then will send the message up to the connected component(s) using the "messagefromchannel" event
 # The components that will use the channel directly, will have to handle "messagefromchannel" event
+# Flow control: a channel with credits accepts a message from a component only while fewer messages than its credits
+# are queued in its pipeline stages or wait for a delay of a stage, e.g. the transmission over a slow link. A credit is
+# returned when a stage has handled an event. Without a credit the sender waits if the policy is BLOCK and the executor
+# can block it, otherwise the new message is dropped and counted.
+# Delays: a stage delays a message by putting it into the next queue with put_later. The delays of all channels are
+# served by one timer wheel of the executor, they overlap and do not hold the thread of the stage.
+# Coalescing: with a coalescing window the first pipeline stage bundles the messages of a sender into a MessageBatch
+# that is closed when the window after its first message expires or its payload reaches coalescesize bytes. The batch
+# passes the stages as one message. The component that it is delivered to unpacks it and handles its messages as
+# consecutive events of one call of handle_events, in the order they were sent, the events that this component passes
+# on go one by one. A message that is not coalesced closes the open batch of its sender first, so a FIFO channel keeps
+# the order of the messages. A prioritized channel keeps it only within a priority class: a batch has the highest
+# priority of its messages and a message of a higher priority overtakes a closed batch of a lower one.
+# Link model: a LinkModelChannel delivers a message after its serialization time, its size over the bandwidth of the
+# link, and the propagation latency of the link. A message is serialized when the link is free in its direction, so
+# the messages queued on a link occupy it one after the other and are delivered in the order they were sent, also when
+# a channel delays one of them on its own, e.g. the LOCAL_MST messages of NodeChannel. The times are taken from the
+# executor, virtual on the discrete event executor and wall clock time on the others.
+# Lossy channels draw their random numbers from blocks that a NumPy generator of the channel fills at once, seeded from
+# the random generator of the channel, so the draws are cheap and reproducible with the seed of the simulation context.
+# A message is sent a geometric number of times, with the mean number of duplicates, and each copy is lost on its own.
 
 class ChannelEventTypes(Enum):
     INCH = "processinchannel"
     DLVR = "delivertocomponent"
+    COAL = "coalesceinchannel"
 
 class Channel(ComponentModel):
+    credits = 0  # 0 disables flow control
+    creditpolicy = QueuePolicies.BLOCK
+    droppedmessages = 0
+    coalescewindow = 0.0  # seconds, 0 disables coalescing
+    coalescesize = 0  # bytes of payload that close a batch before its window, 0 for no limit
+    transientattributes = ComponentModel.transientattributes | {'outputqueue', 'channelqueue', 'creditcondition',
+                                                                'coalescelock'}
 
     def on_init(self, eventobj: Event):
 
@@ -35,7 +66,44 @@ class Channel(ComponentModel):
     def on_message_from_top(self, eventobj: Event):
         # channel receives the input message and will process the message by the process event in the next pipeline stage
         myevent = Event(eventobj.eventsource, ChannelEventTypes.INCH, eventobj.eventcontent)
-        self.channelqueue.put_nowait(myevent)
+        self.put_in_channel(myevent)
+
+    # Puts a message into the interim pipeline stage, through the coalescing stage if it is enabled
+    def put_in_channel(self, eventobj: Event):
+        if self.coalescewindow <= 0:
+            self.channelqueue.put_nowait(eventobj)
+            return
+        sender = eventobj.eventsource.componentinstancenumber
+        with self.coalescelock:
+            batch = self.coalescing.get(sender)
+            if not self.coalesces(eventobj):
+                if batch is not None:
+                    self.close_batch(eventobj.eventsource, batch)
+                self.channelqueue.put_nowait(eventobj)
+                return
+            if batch is None:
+                batch = self.coalescing[sender] = MessageBatch()
+                self.channelqueue.put_later(Event(eventobj.eventsource, ChannelEventTypes.COAL, batch),
+                                            self.coalescewindow)
+            batch.add(eventobj.eventcontent, eventobj.priority)
+            if self.coalescesize and batch.nbytes >= self.coalescesize:
+                self.close_batch(eventobj.eventsource, batch)
+
+    # Overwrite coalesces if some messages must pass the channel on their own
+    def coalesces(self, eventobj: Event):
+        return True
+
+    # Called with the coalescing lock held
+    def close_batch(self, source, batch):
+        self.context.coalescing = True
+        del self.coalescing[source.componentinstancenumber]
+        self.channelqueue.put_nowait(Event(source, ChannelEventTypes.INCH, batch, priority=batch.priority))
+
+    # The window of a batch expired, it is still open unless it reached its size or a message closed it
+    def on_coalesce_timeout(self, eventobj: Event):
+        with self.coalescelock:
+            if self.coalescing.get(eventobj.eventsource.componentinstancenumber) is eventobj.eventcontent:
+                self.close_batch(eventobj.eventsource, eventobj.eventcontent)
 
     # Overwrite onProcessInChannel if you want to do something in interim pipeline stage
     def on_process_in_channel(self, eventobj: Event):
@@ -61,19 +129,120 @@ class Channel(ComponentModel):
 
     def __init__(self, componentname, componentinstancenumber):
         super().__init__(componentname, componentinstancenumber)
-        self.outputqueue = queue.Queue()
-        self.channelqueue = queue.Queue()
         self.eventhandlers[ChannelEventTypes.INCH] = self.on_process_in_channel
         self.eventhandlers[ChannelEventTypes.DLVR] = self.on_deliver_to_component
+        self.eventhandlers[ChannelEventTypes.COAL] = self.on_coalesce_timeout
+        # note that the input queue is created by the super class...
+        self.outputqueue = self.create_queue()
+        self.channelqueue = self.create_queue()
+        self.creditcondition = Condition()
+        self.coalescing = {}  # sender instance number -> the open batch of the sender
+        self.coalescelock = Lock()
+
+    def trigger_event(self, eventobj: Event):
+        if self.credits and eventobj.event == EventTypes.MFRT and not self.acquire_credit():
+            return
+        if self.tracer is not None or self.metrics is not None:
+            eventobj = eventobj.restamped()
+            if self.tracer is not None:
+                self.tracer.trigger(self, eventobj)
+        self.inputqueue.put_nowait(eventobj)
 
-        for i in range(self.num_worker_threads):
-            # note that the input queue is handled by the super class...
-            t = Thread(target=self.queue_handler, args=[self.channelqueue])
-            t1 = Thread(target=self.queue_handler, args=[self.outputqueue])
-            t.daemon = True
-            t1.daemon = True
-            t.start()
-            t1.start()
+    # The number of events queued in the pipeline stages of the channel or delayed into them
+    def backlog(self):
+        return sum(myqueue.qsize() + myqueue.delayed for myqueue in self.queues)
+
+    # Returns False if the new message is dropped
+    def acquire_credit(self):
+        with self.creditcondition:
+            if self.backlog() < self.credits:
+                return True
+            if self.creditpolicy == QueuePolicies.BLOCK:
+                if self.executor.can_block(self.inputqueue):
+                    self.creditcondition.wait_for(lambda: self.terminated or self.backlog() < self.credits)
+                return not self.terminated
+            self.droppedmessages += 1
+            return False
+
+    def handle_events(self, workitems):
+        yield from super().handle_events(workitems)
+        if self.credits:
+            with self.creditcondition:
+                self.creditcondition.notify_all()
+
+    def terminate(self, drain=False):
+        super().terminate(drain)
+        with self.creditcondition:
+            self.creditcondition.notify_all()
+
+# Numbers drawn from blocks of a NumPy generator, a block per distribution and parameter
+class RandomBlocks:
+    blocksize = 4096
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.blocks = {}  # key -> [values, index of the next value]
+
+    def draw(self, count, key, sample):
+        try:
+            block = self.blocks[key]
+        except KeyError:
+            block = self.blocks[key] = [[], 0]
+        values, index = block
+        if index + count <= len(values):
+            block[1] = index + count
+            return values[index:index + count]
+        drawn = values[index:]
+        block[0] = sample(max(self.blocksize, count - len(drawn)))
+        block[1] = count - len(drawn)
+        return drawn + block[0][:block[1]]
+
+    def uniforms(self, count):
+        return self.draw(count, None, lambda size: self.generator.random(size).tolist())
+
+    # The number of trials up to the first success, at least 1
+    def geometrics(self, count, p):
+        return self.draw(count, p, lambda size: self.generator.geometric(p, size).tolist())
+
+class LinkModelChannel(Channel):
+    latency = 0.0  # seconds
+    bandwidth = inf  # bytes per second
+    headersize = 64  # bytes sent with every message besides its payload
+    transientattributes = Channel.transientattributes | {'linklock'}
+
+    def __init__(self, componentname, componentinstancenumber):
+        super().__init__(componentname, componentinstancenumber)
+        self.busyuntil = {}  # sender instance number -> the time the link is free in the direction of the sender
+        self.transmittedbytes = 0
+        self.transmittedmessages = 0
+        self.linklock = Lock()
+
+    def message_size(self, eventobj: Event):
+        return self.headersize + message_size(eventobj.eventcontent)
+
+    # The delay from now until the message is delivered, occupies the link until the message is serialized. A message
+    # with an extra delay is serialized after it, the messages sent after it wait for it
+    def transmission_delay(self, eventobj: Event, extradelay=0.0):
+        size = self.message_size(eventobj)
+        sender = eventobj.eventsource.componentinstancenumber
+        with self.linklock:
+            self.transmittedbytes += size
+            self.transmittedmessages += 1
+            now = self.executor.time()
+            start = max(now + extradelay, self.busyuntil.get(sender, now))
+            self.busyuntil[sender] = start + size / self.bandwidth
+            return self.busyuntil[sender] + self.latency - now
+
+    # Puts the message into the output queue when it is delivered, extradelay is spent before the message is serialized
+    def transmit(self, eventobj: Event, extradelay=0.0):
+        delay = self.transmission_delay(eventobj, extradelay)
+        if delay > 0:
+            self.outputqueue.put_later(eventobj, delay)
+        else:
+            self.outputqueue.put_nowait(eventobj)
+
+    def on_process_in_channel(self, eventobj: Event):
+        self.transmit(Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent))
 
 class AHCChannelError(Exception):
     pass
@@ -89,7 +258,7 @@ class P2PFIFOPerfectChannel(Channel):
             if hdr.interfaceid == self.componentinstancenumber:
                 #print(f"Will forward message since {hdr.interfaceid} and {self.componentinstancenumber}")
                 myevent = Event(eventobj.eventsource, ChannelEventTypes.INCH, eventobj.eventcontent)
-                self.channelqueue.put_nowait(myevent)
+                self.put_in_channel(myevent)
             else:
                 #print(f"Will drop message since {hdr.interfaceid} and {self.componentinstancenumber}")
                 pass
@@ -120,6 +289,7 @@ class P2PFIFOPerfectChannel(Channel):
             self.connectors[name] = component
         # except AHCChannelError as e:
         #    print( f"{e}" )
+        self.compile_routes()
 
 class P2PFIFOFairLossChannel(P2PFIFOPerfectChannel):
     prob = 1
@@ -134,18 +304,38 @@ class P2PFIFOFairLossChannel(P2PFIFOPerfectChannel):
             if hdr.interfaceid == self.componentinstancenumber:
                 #print(f"Will forward message since {hdr.interfaceid} and {self.componentinstancenumber}")
                 myevent = Event(eventobj.eventsource, ChannelEventTypes.INCH, eventobj.eventcontent)
-                self.channelqueue.put_nowait(myevent)
+                self.put_in_channel(myevent)
             else:
                 #print(f"Will drop message since {hdr.interfaceid} and {self.componentinstancenumber}")
                 pass
 
 
+    def __init__(self, componentname, componentinstancenumber):
+        super().__init__(componentname, componentinstancenumber)
+        self.randomblocks = RandomBlocks(np.random.default_rng(self.random.getrandbits(64)))
+        self.batchhandlers[ChannelEventTypes.INCH] = self.on_process_batch_in_channel
+
     def on_process_in_channel(self, eventobj: Event):
-        if random.random() < self.prob:
-            myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent)
-            self.outputqueue.put_nowait(myevent)
-        if random.random() < self.duplicationprobability:
-            self.channelqueue.put_nowait(eventobj)
+        self.on_process_batch_in_channel([eventobj])
+
+    def on_process_batch_in_channel(self, eventobjs):
+        for eventobj, copies in zip(eventobjs, self.delivered_copies(len(eventobjs))):
+            for i in range(copies):
+                myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent)
+                self.outputqueue.put_nowait(myevent)
+
+    # The probability that a copy of each of the next count messages is delivered
+    def delivery_probabilities(self, count):
+        return [self.prob] * count
+
+    # The number of delivered copies of each of the next count messages
+    def delivered_copies(self, count):
+        probabilities = self.delivery_probabilities(count)
+        if self.duplicationprobability == 0:
+            return [int(u < p) for u, p in zip(self.randomblocks.uniforms(count), probabilities)]
+        sent = self.randomblocks.geometrics(count, 1 - self.duplicationprobability)
+        uniforms = iter(self.randomblocks.uniforms(sum(sent)))
+        return [sum(next(uniforms) < p for i in range(copies)) for copies, p in zip(sent, probabilities)]
 
     def setPacketLossProbability(self, prob):
         self.prob = prob
@@ -156,5 +346,92 @@ class P2PFIFOFairLossChannel(P2PFIFOPerfectChannel):
         else:
             self.duplicationprobability = 0
 
+# Gilbert-Elliott burst loss: the link is either good or bad and loses the messages with the loss probability of its
+# state, it turns bad after a message with probability goodtobad and good again with probability badtogood. The number
+# of messages the link stays in a state is geometric, it is drawn once per state instead of a draw per message.
+class P2PFIFOGilbertElliottChannel(P2PFIFOFairLossChannel):
+    goodtobad = 0.01
+    badtogood = 0.25
+    goodloss = 0.0
+    badloss = 1.0
+
+    def __init__(self, componentname, componentinstancenumber):
+        super().__init__(componentname, componentinstancenumber)
+        self.bad = False
+        self.sojourn = None  # the number of messages left in the current state
+
+    def delivery_probabilities(self, count):
+        probabilities = []
+        while len(probabilities) < count:
+            if self.sojourn is None:
+                self.sojourn = self.draw_sojourn()
+            elif self.sojourn == 0:
+                self.bad = not self.bad
+                self.sojourn = self.draw_sojourn()
+            messages = min(self.sojourn, count - len(probabilities))
+            probabilities.extend([1 - (self.badloss if self.bad else self.goodloss)] * messages)
+            self.sojourn -= messages
+        return probabilities
+
+    def draw_sojourn(self):
+        leave = self.badtogood if self.bad else self.goodtobad
+        if leave <= 0:
+            return inf
+        return self.randomblocks.geometrics(1, leave)[0]
+
+    def setBurstLoss(self, goodtobad, badtogood, goodloss=0.0, badloss=1.0):
+        self.goodtobad = goodtobad
+        self.badtogood = badtogood
+        self.goodloss = goodloss
+        self.badloss = badloss
+
+# A shared medium, e.g. a wireless channel, that all of its members are connected to. It is a single collision domain:
+# a message is delivered to every member except its sender, whether the graph of the topology links them or not, see
+# Topology.construct_broadcast_medium. The members share one event, they must not change the message. With a
+# collision window the messages of different senders that are sent within the window of each other collide and are
+# lost, every message is delivered after the window.
 class FIFOBroadcastPerfectChannel(Channel):
-    pass
+    collisionwindow = 0.0  # seconds, 0 disables collisions
+    transientattributes = Channel.transientattributes | {'members'}
+
+    def __init__(self, componentname, componentinstancenumber):
+        super().__init__(componentname, componentinstancenumber)
+        self.members = {}  # instance number -> component, in the order they joined
+        self.contending = deque()  # (start time, sender, event) of the messages sent within the window
+        self.collided = set()  # the events of the messages that collided and are not delivered yet
+        self.collisions = 0
+
+    def connect_me_to_component(self, name, component):
+        super().connect_me_to_component(name, component)
+        self.members[component.componentinstancenumber] = component
+
+    def disconnect_me_from_component(self, name, component):
+        super().disconnect_me_from_component(name, component)
+        self.members.pop(component.componentinstancenumber, None)
+
+    def on_process_in_channel(self, eventobj: Event):
+        myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent)
+        if self.collisionwindow <= 0:
+            self.outputqueue.put_nowait(myevent)
+            return
+        now = self.executor.time()
+        sender = eventobj.eventsource.componentinstancenumber
+        while self.contending and now - self.contending[0][0] >= self.collisionwindow:
+            self.contending.popleft()
+        for start, othersender, otherevent in self.contending:
+            if othersender != sender:
+                self.collided.add(otherevent)
+                self.collided.add(myevent)
+        self.contending.append((now, sender, myevent))
+        self.outputqueue.put_later(myevent, self.collisionwindow)
+
+    def on_deliver_to_component(self, eventobj: Event):
+        if eventobj in self.collided:
+            self.collided.discard(eventobj)
+            self.collisions += 1
+            return
+        sender = eventobj.eventsource.componentinstancenumber
+        myevent = Event(eventobj.eventsource, EventTypes.MFRB, eventobj.eventcontent, self.componentinstancenumber)
+        for instancenumber, member in self.members.items():
+            if instancenumber != sender:
+                member.trigger_event(myevent)
@@ -0,0 +1,109 @@
+import io
+import pickle
+
+import numpy as np
+
+from Ahc.Ahc import ComponentModel, current_context
+
+# A checkpoint saves the states of the components, the events pending in their queues and the random generators of a
+# simulation. The components are saved by their keys, a checkpoint is loaded into a topology that is constructed the
+# same way by Topology.resume, e.g. to continue an interrupted run or to branch from a constructed MST.
+# The states are pickled with protocol 5 and the NumPy arrays in them are kept out of band, the pickle and the buffers
+# of the arrays are stored as arrays of an uncompressed .npz file, so the arrays are neither copied into the pickle
+# nor converted.
+# A checkpoint is consistent if no event is handled while it is saved: between the steps of the discrete event
+# executor, or when the simulation is quiescent.
+
+VERSION = 1
+
+class CheckpointError(Exception):
+    pass
+
+class CheckpointPickler(pickle.Pickler):
+    def __init__(self, file, context, buffers):
+        super().__init__(file, protocol=5, buffer_callback=buffers.append)
+        self.context = context
+
+    # The components and the simulation objects are referred to, they are not part of the states
+    def persistent_id(self, obj):
+        if isinstance(obj, ComponentModel):
+            return "component", obj.componentname + str(obj.componentinstancenumber)
+        if obj is self.context.registry:
+            return "registry", None
+        if obj is self.context.topology:
+            return "topology", None
+        return None
+
+class CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, context, buffers):
+        super().__init__(file, buffers=buffers)
+        self.context = context
+
+    def persistent_load(self, pid):
+        kind, key = pid
+        if kind == "registry":
+            return self.context.registry
+        if kind == "topology":
+            return self.context.topology
+        try:
+            return self.context.registry.components[key]
+        except KeyError:
+            raise CheckpointError(f"Component {key} of the checkpoint is not in the topology")
+
+def save_checkpoint(path, context=None):
+    if context is None:
+        context = current_context()
+    components = context.registry.components
+    executor = context.get_executor()
+    pending = executor.pending_events([myqueue for cmp in components.values() for myqueue in cmp.queues])
+    checkpoint = {
+        "version": VERSION,
+        "seed": context.seed,
+        "random": context.random.getstate(),
+        "time": executor.time() if hasattr(executor, "now") else 0.0,
+        "states": {key: cmp.get_state() for key, cmp in components.items()},
+        "queues": {key: [pending[myqueue] for myqueue in cmp.queues] for key, cmp in components.items()},
+    }
+    buffers = []
+    data = io.BytesIO()
+    CheckpointPickler(data, context, buffers).dump(checkpoint)
+    arrays = {f"buffer{i}": np.frombuffer(buffer.raw(), np.uint8) for i, buffer in enumerate(buffers)}
+    graph = pickle.dumps((context.seed, getattr(context.topology, "G", None)), protocol=5)
+    with open(path, "wb") as f:
+        np.savez(f, checkpoint=np.frombuffer(data.getbuffer(), np.uint8), graph=np.frombuffer(graph, np.uint8),
+                 **arrays)
+
+# The seed of the simulation and the graph of its topology, to construct the topology before the checkpoint is loaded
+def load_checkpoint_graph(path):
+    with np.load(path) as arrays:
+        return pickle.loads(arrays["graph"].tobytes())
+
+def load_checkpoint(path, context=None):
+    if context is None:
+        context = current_context()
+    with np.load(path) as arrays:
+        buffers = [arrays[f"buffer{i}"] for i in range(sum(name.startswith("buffer") for name in arrays.files))]
+        data = arrays["checkpoint"].tobytes()
+    checkpoint = CheckpointUnpickler(io.BytesIO(data), context, buffers).load()
+    if checkpoint["version"] != VERSION:
+        raise CheckpointError(f"{path} is a checkpoint of version {checkpoint['version']}")
+    components = context.registry.components
+    missing = components.keys() - checkpoint["states"].keys()
+    if missing:
+        raise CheckpointError(f"Components {sorted(missing)} are not in the checkpoint")
+
+    context.random.setstate(checkpoint["random"])
+    executor = context.get_executor()
+    if hasattr(executor, "now"):
+        executor.now = checkpoint["time"]
+    for key, state in checkpoint["states"].items():
+        components[key].set_state(state)
+    for key, queues in checkpoint["queues"].items():
+        for myqueue, events in zip(components[key].queues, queues):
+            for delay, eventobj in events:
+                if eventobj.is_batch():
+                    context.coalescing = True
+                if delay > 0:
+                    myqueue.put_later(eventobj, delay)
+                else:
+                    myqueue.put_nowait(eventobj)
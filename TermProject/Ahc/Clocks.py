@@ -0,0 +1,97 @@
+import contextvars
+import math
+import threading
+
+# Every component with a clock is a process of the causal order. An event is stamped with the clock of the component
+# whose handler creates it, sending ticks the clock. The component that handles the event merges the stamp into its
+# clock and ticks it. The events triggered from outside, e.g. by a user command or the registry, carry no stamp.
+# Clocks are enabled per simulation context by ComponentRegistry.enable_clocks.
+# A vector clock is kept sparse, as a base and a delta that hold the nonzero entries. The base is shared by the stamps
+# of a component and never changed, a stamp copies only the delta. When the delta grows over the square root of the
+# size of the base it is folded into a new base with a new version. A receiver that has merged a version of the base
+# of a process skips the bases up to that version, so a stamp costs O(sqrt(n)) for n processes instead of O(n).
+
+currentcomponent = contextvars.ContextVar("currentcomponent", default=None)  # the component whose handler runs
+
+MINDELTA = 16
+
+class ClockStamp:
+    __slots__ = ('process', 'lamport', 'version', 'base', 'delta')
+
+    def __init__(self, process, lamport, version, base, delta):
+        self.process = process
+        self.lamport = lamport
+        self.version = version
+        self.base = base
+        self.delta = delta
+
+    def __getitem__(self, process):
+        try:
+            return self.delta[process]
+        except KeyError:
+            return self.base.get(process, 0)
+
+    def as_dict(self):
+        return {**self.base, **self.delta}
+
+    # Whether the event of this stamp causally precedes the event of the other one
+    def happened_before(self, other):
+        if self.lamport >= other.lamport:
+            return False
+        return all(count <= other[process] for process, count in self.as_dict().items())
+
+    def concurrent(self, other):
+        return not self.happened_before(other) and not other.happened_before(self)
+
+class LogicalClock:
+    def __init__(self, process):
+        self.process = process
+        self.lamport = 0
+        self.version = 0
+        self.base = {}
+        self.delta = {}
+        self.mergedversions = {}  # the last version of the base of each process that is merged
+        self.lock = threading.Lock()  # a component may be handled by several workers at once
+
+    def __getitem__(self, process):
+        try:
+            return self.delta[process]
+        except KeyError:
+            return self.base.get(process, 0)
+
+    # Called with the lock held
+    def tick(self):
+        self.lamport += 1
+        self.delta[self.process] = self[self.process] + 1
+        if len(self.delta) > max(MINDELTA, math.isqrt(len(self.base))):
+            self.base = {**self.base, **self.delta}
+            self.delta = {}
+            self.version += 1
+
+    def send(self):
+        with self.lock:
+            self.tick()
+            return ClockStamp(self.process, self.lamport, self.version, self.base, dict(self.delta))
+
+    # Merges the stamps of the events that are handled at once
+    def receive(self, stamps):
+        with self.lock:
+            for stamp in stamps:
+                if stamp is None:
+                    continue
+                if stamp.lamport > self.lamport:
+                    self.lamport = stamp.lamport
+                if self.mergedversions.get(stamp.process, -1) < stamp.version:
+                    self.merge(stamp.base)
+                    self.mergedversions[stamp.process] = stamp.version
+                self.merge(stamp.delta)
+            self.tick()
+
+    def merge(self, entries):
+        for process, count in entries.items():
+            if count > self[process]:
+                self.delta[process] = count
+
+    def stamp(self):
+        with self.lock:
+            return ClockStamp(self.process, self.lamport, self.version, self.base, dict(self.delta))
@@ -0,0 +1,860 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from enum import Enum
+from threading import Thread, Condition
+
+# Executors decide how the event queues of the components are serviced.
+# Every component asks the executor of the registry for its queues (inputqueue, and channelqueue and outputqueue for
+# channels) and the executor delivers the queued events to ComponentModel.handle_event.
+# The simulation context that owns an executor is the current context while its workers handle events.
+# ThreadExecutor is the original model: every queue is served by dedicated daemon threads.
+# PoolExecutor serves all queues by a fixed number of worker threads, a queue is handled by one worker at a time.
+# DiscreteEventExecutor runs all components in a single thread over a global queue ordered by virtual time.
+# AsyncioExecutor serves every queue by an asyncio task, the event handlers may be coroutines.
+# A stopped queue drops the events triggered afterwards, its pending events are either handled (drain) or discarded.
+# Executor.shutdown waits until the workers of the stopped queues have finished and reports whether all stopped.
+# The executors count the outstanding events, i.e. the queued, the delayed and the ones being handled. The simulation
+# is quiescent when the count drops to zero, no component can trigger an event afterwards unless it is triggered
+# from outside, e.g. by a user command.
+# The workers take up to component.batchsize pending events of a queue at once and dispatch them by
+# ComponentModel.handle_events, a sentinel is always taken alone. A handler that raises an exception fails only its own
+# events, they are counted in the failedevents of the component and the other events of the batch are handled.
+# A queue with a capacity applies its policy when it is full: BLOCK makes the sender wait for room, DROPOLDEST discards
+# the oldest pending event and DROPNEWEST the new one, the discarded events are counted in dropped. Only the
+# ThreadExecutor can block a sender, and not on the queue its own thread serves. Otherwise the event is accepted over
+# the capacity and counted in overflowed.
+# The events of a prioritized queue are handled by their aged priority: an event is handed over before the ones that
+# were put up to agingwindow puts earlier with a priority that is one level lower, so the low priorities do not starve.
+# The delayed events of the thread and the pool executors, e.g. the delays of the channels, are put by a timer wheel
+# that is shared by all queues of the executor, a delay does not hold the thread that puts the event.
+
+inf = float('inf')
+STOPQUEUE = object()  # the sentinel that makes the worker of a queue return
+DISCARDED = object()  # replaces the item of a discrete event that is no longer pending
+
+class QueuePolicies(Enum):
+    BLOCK = "block"
+    DROPOLDEST = "dropoldest"
+    DROPNEWEST = "dropnewest"
+
+# The limits and the counters shared by all event queues, set by ComponentModel.create_queue
+class BoundedQueue:
+    capacity = 0  # 0 is unbounded
+    policy = QueuePolicies.BLOCK
+    dropped = 0
+    overflowed = 0
+    highwater = 0  # the largest number of pending events so far
+    delayed = 0  # the events that wait for their put_later delay, counted as pending by the discrete event queues
+
+# The state of the current worker thread: the queue it serves, nonblocking in the timer thread and the event loop that
+# runs its coroutine handlers
+workerstate = threading.local()
+
+# A hierarchical timer wheel driven by a single thread. A timer is put into the slot of its expiry tick on the lowest
+# level whose span covers its delay, the timers of a slot of a higher level are moved down when the level below wraps
+# around to that slot. Scheduling is O(1) and the thread sleeps until the next tick that has timers or has to move
+# them, the timers farther than the span of the top level wait in overflow until it wraps around.
+# The callbacks run in the timer thread, they must not block. Every timer is a scheduled event of the executor, the
+# timers that are dropped when the wheel stops are done for it.
+class TimerWheel:
+    def __init__(self, executor, resolution=0.001, slots=256, levels=3):
+        self.executor = executor
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[[] for j in range(slots)] for i in range(levels)]
+        self.overflow = []
+        self.origin = time.monotonic()
+        self.tick = 0  # the last tick that is processed
+        self.count = 0
+        self.condition = Condition()
+        self.thread = None
+        self.stopped = False
+
+    def current_tick(self):
+        return int((time.monotonic() - self.origin) / self.resolution)
+
+    def schedule(self, delay, function, *args):
+        with self.condition:
+            if self.stopped:
+                self.executor.event_done()
+                return
+            if self.thread is None:
+                self.thread = Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            if self.count == 0:
+                self.tick = self.current_tick()  # nothing to move while idle
+            expiry = math.ceil((time.monotonic() + delay - self.origin) / self.resolution)
+            self.insert(max(expiry, self.tick + 1), (function, args))
+            self.count += 1
+            self.condition.notify()
+
+    # Called with the lock held
+    def insert(self, expiry, timer):
+        delta = expiry - self.tick
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span:
+                self.wheels[level][expiry // (span // self.slots) % self.slots].append((expiry, timer))
+                return
+            span *= self.slots
+        self.overflow.append((expiry, timer))
+
+    # The next tick that has timers on the lowest level, or where a higher level has to be moved down
+    def next_tick(self):
+        boundary = (self.tick // self.slots + 1) * self.slots
+        wheel = self.wheels[0]
+        for tick in range(self.tick + 1, boundary):
+            if wheel[tick % self.slots]:
+                return tick
+        return boundary
+
+    # Moves the timers down from the higher levels that wrap around at the tick, then takes the expired ones
+    def advance(self, tick):
+        self.tick = tick
+        if tick % self.slots ** self.levels == 0:
+            overflow, self.overflow = self.overflow, []
+            for expiry, timer in overflow:
+                self.insert(expiry, timer)
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if tick % span == 0:
+                slot = self.wheels[level][tick // span % self.slots]
+                self.wheels[level][tick // span % self.slots] = []
+                for expiry, timer in slot:
+                    self.insert(expiry, timer)
+        expired = self.wheels[0][tick % self.slots]
+        self.wheels[0][tick % self.slots] = []
+        self.count -= len(expired)
+        return expired
+
+    def run(self):
+        workerstate.nonblocking = True
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    if self.count == 0:
+                        self.condition.wait()
+                        continue
+                    tick = self.next_tick()
+                    wait = self.origin + tick * self.resolution - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self.condition.wait(wait)
+                expired = self.advance(tick)
+            for expiry, (function, args) in expired:
+                try:
+                    function(*args)
+                except Exception:
+                    traceback.print_exc()
+
+    # The pending timers are dropped
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            dropped, self.count = self.count, 0
+            self.wheels = [[[] for j in range(self.slots)] for i in range(self.levels)]
+            self.overflow = []
+            self.condition.notify()
+        if dropped:
+            self.executor.event_done(dropped)
+
+# Replaces the deque of a prioritized queue, it provides the deque operations that queue.Queue and asyncio.Queue use
+class PriorityContainer:
+    def __init__(self, agingwindow):
+        self.agingwindow = agingwindow
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def append(self, item):
+        sequence = next(self.sequence)
+        key = inf if item is STOPQUEUE else sequence + item.priority.value * self.agingwindow
+        heapq.heappush(self.heap, (key, sequence, item))
+
+    def popleft(self):
+        return heapq.heappop(self.heap)[2]
+
+    # The item that was appended first, e.g. to make room in a full queue, wherever its priority placed it
+    def popoldest(self):
+        index = min(range(len(self.heap)), key=lambda i: self.heap[i][1])
+        entry = self.heap[index]
+        self.heap[index] = self.heap[-1]
+        self.heap.pop()
+        heapq.heapify(self.heap)
+        return entry[2]
+
+    # Only the next item can be peeked
+    def __getitem__(self, index):
+        return self.heap[index][2]
+
+    def __len__(self):
+        return len(self.heap)
+
+    # In the order the items are handed over
+    def __iter__(self):
+        return (entry[2] for entry in sorted(self.heap))
+
+    def clear(self):
+        self.heap.clear()
+
+def create_container(component, prioritized):
+    if prioritized:
+        return PriorityContainer(component.agingwindow)
+    return deque()
+
+def pop_oldest(container):
+    if isinstance(container, PriorityContainer):
+        return container.popoldest()
+    return container.popleft()
+
+# Event handlers may be coroutines, executors that are not running an event loop run them to completion in the worker
+# like a blocking handler, on an event loop that every worker thread creates once and keeps
+def run_coroutine(result):
+    if asyncio.iscoroutine(result):
+        try:
+            loop = workerstate.loop
+        except AttributeError:
+            loop = workerstate.loop = asyncio.new_event_loop()
+        loop.run_until_complete(result)
+
+def resolve_future(future):
+    if not future.done():
+        future.set_result(True)
+
+class Executor:
+    context = None  # set by SimulationContext.set_executor
+
+    def __init__(self):
+        self.outstanding = 0
+        self.quiescentcondition = Condition()
+        self.quiescentwaiters = []
+
+    def event_scheduled(self):
+        with self.quiescentcondition:
+            self.outstanding += 1
+
+    def event_done(self, count=1):
+        with self.quiescentcondition:
+            self.outstanding -= count
+            if self.outstanding == 0:
+                self.quiescentcondition.notify_all()
+                for loop, future in self.quiescentwaiters:
+                    loop.call_soon_threadsafe(resolve_future, future)
+                self.quiescentwaiters = []
+
+    # Blocks until there is no outstanding event, returns False if the timeout expires first.
+    # A handler running on the loop of an AsyncioExecutor must await wait_until_quiescent_async instead
+    def wait_until_quiescent(self, timeout=None):
+        with self.quiescentcondition:
+            return self.quiescentcondition.wait_for(lambda: self.outstanding == 0, timeout)
+
+    async def wait_until_quiescent_async(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        with self.quiescentcondition:
+            if self.outstanding == 0:
+                return True
+            future = loop.create_future()
+            self.quiescentwaiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    # Called once by each worker thread of the executor
+    def activate_context(self):
+        if self.context is not None:
+            self.context.activate()
+
+    # Used by the executors that handle the events in the thread of the caller
+    def context_scope(self):
+        if self.context is None:
+            return contextlib.nullcontext()
+        return self.context
+
+    def stop_queue(self, myqueue, drain=False):
+        myqueue.stop(drain)
+
+    def shutdown(self, timeout=None):
+        return True
+
+    # Whether the calling thread may wait for room in the queue
+    def can_block(self, myqueue):
+        return False
+
+    # The events of the queues as (delay, event) in the order they are handled, for checkpoints. The events that are
+    # delayed by the real-time executors are not included, checkpoints of them are taken when they are quiescent
+    def pending_events(self, queues):
+        return {myqueue: myqueue.pending_items() for myqueue in queues}
+
+class EventQueue(queue.Queue, BoundedQueue):
+    def __init__(self, executor, component, prioritized=False):
+        self.executor = executor
+        self.component = component
+        self.prioritized = prioritized
+        self.stopped = False
+        super().__init__()
+
+    def _init(self, maxsize):
+        self.queue = create_container(self.component, self.prioritized)
+
+    # Called by queue.Queue with the mutex held
+    def _put(self, item):
+        super()._put(item)
+        if item is not STOPQUEUE:
+            self.executor.event_scheduled()
+            if self._qsize() > self.highwater:
+                self.highwater = self._qsize()
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if self.stopped:
+                return
+            if self.capacity and self._qsize() >= self.capacity and not self.make_room():
+                return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    # Called with the mutex held, returns False if the new item is dropped
+    def make_room(self):
+        if self.policy == QueuePolicies.DROPNEWEST:
+            self.dropped += 1
+            return False
+        if self.policy == QueuePolicies.DROPOLDEST:
+            pop_oldest(self.queue)
+            self.unfinished_tasks -= 1
+            self.dropped += 1
+            self.executor.event_done()
+        elif self.executor.can_block(self):
+            self.not_full.wait_for(lambda: self.stopped or self._qsize() < self.capacity)
+            return not self.stopped
+        else:
+            self.overflowed += 1
+        return True
+
+    # Puts a sentinel for each of the workers after the pending events, or instead of them if drain is False
+    def stop(self, drain=False, workers=0):
+        with self.mutex:
+            self.stopped = True
+            if not drain:
+                discarded = self._qsize()
+                self.queue.clear()
+                self.unfinished_tasks -= discarded
+                if self.unfinished_tasks == 0:
+                    self.all_tasks_done.notify_all()
+                if discarded:
+                    self.executor.event_done(discarded)
+            for i in range(workers):
+                self._put(STOPQUEUE)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+            self.not_full.notify_all()  # releases the blocked senders
+
+    # Waits for the first item unless block is False, then takes the pending items up to maxitems or a sentinel
+    def get_batch(self, maxitems, block=True):
+        with self.not_empty:
+            if not block and not self._qsize():
+                return []
+            while not self._qsize():
+                self.not_empty.wait()
+            items = [self._get()]
+            if items[0] is not STOPQUEUE:
+                while len(items) < maxitems and self._qsize() and self.queue[0] is not STOPQUEUE:
+                    items.append(self._get())
+            self.not_full.notify(len(items))
+            return items
+
+    def pending_items(self):
+        with self.mutex:
+            return [(0, item) for item in self.queue if item is not STOPQUEUE]
+
+    def task_done_batch(self, count):
+        with self.all_tasks_done:
+            self.unfinished_tasks -= count
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+
+    # Does not hold the thread during the delay
+    def put_later(self, item, delay):
+        with self.mutex:
+            self.delayed += 1
+        self.executor.event_scheduled()
+        self.executor.timerwheel.schedule(delay, self.deliver_later, item)
+
+    def deliver_later(self, item):
+        with self.mutex:
+            self.delayed -= 1
+        self.put_nowait(item)
+        self.executor.event_done()
+
+class ThreadExecutor(Executor):
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+        self.timerwheel = TimerWheel(self)
+
+    def create_queue(self, component, prioritized=False):
+        myqueue = EventQueue(self, component, prioritized)
+        for i in range(component.num_worker_threads):
+            t = Thread(target=self.queue_worker, args=[component, myqueue])
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+        return myqueue
+
+    def stop_queue(self, myqueue, drain=False):
+        myqueue.stop(drain, myqueue.component.num_worker_threads)
+
+    # The threads return when they get the sentinels of their stopped queues
+    def shutdown(self, timeout=None):
+        self.timerwheel.stop()
+        threads = self.threads if self.timerwheel.thread is None else self.threads + [self.timerwheel.thread]
+        return join_threads(threads, timeout)
+
+    # A thread that waits for room in its own queue would never make room, the timer thread must not wait at all
+    def can_block(self, myqueue):
+        return getattr(workerstate, "queue", None) is not myqueue and not getattr(workerstate, "nonblocking", False)
+
+    def queue_worker(self, component, myqueue):
+        self.activate_context()
+        workerstate.queue = myqueue
+        component.queue_handler(myqueue)
+
+    def time(self):
+        return time.monotonic()
+
+def join_threads(threads, timeout=None):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for t in threads:
+        t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    return not any(t.is_alive() for t in threads)
+
+class PooledEventQueue(EventQueue):
+    def __init__(self, executor, component, prioritized=False):
+        self.scheduled = False  # True while the queue waits in the ready queue or is being handled by a worker
+        super().__init__(executor, component, prioritized)
+
+    # Called by queue.Queue with the mutex held
+    def _put(self, item):
+        super()._put(item)
+        if not self.scheduled:
+            self.scheduled = True
+            self.executor.schedule(self)
+
+class PoolExecutor(Executor):
+    def __init__(self, num_worker_threads=None):
+        super().__init__()
+        if num_worker_threads is None:
+            num_worker_threads = os.cpu_count() or 1
+        self.num_worker_threads = num_worker_threads
+        self.readyqueues = queue.Queue()
+        self.timerwheel = TimerWheel(self)
+        self.workers = []
+        self.scheduledqueues = 0
+        self.idlecondition = Condition()
+
+    # The workers are started with the first queue, after the executor is given to its simulation context
+    def create_queue(self, component, prioritized=False):
+        if not self.workers:
+            for i in range(self.num_worker_threads):
+                t = Thread(target=self.worker)
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
+        return PooledEventQueue(self, component, prioritized)
+
+    def time(self):
+        return time.monotonic()
+
+    # Called with the mutex of the queue held
+    def schedule(self, myqueue):
+        with self.idlecondition:
+            self.scheduledqueues += 1
+        self.readyqueues.put_nowait(myqueue)
+
+    # Handles a batch of events of a ready queue and puts the queue back to the end of the ready queue if it is not empty,
+    # so that the events of a queue are handled in FIFO order and busy queues do not starve the others
+    def worker(self):
+        self.activate_context()
+        while True:
+            myqueue = self.readyqueues.get()
+            if myqueue is STOPQUEUE:
+                break
+            workitems = myqueue.get_batch(myqueue.component.batchsize, block=False)  # empty if the queue is discarded
+            if workitems:
+                try:
+                    for result in myqueue.component.handle_events(workitems):
+                        run_coroutine(result)
+                except Exception:
+                    traceback.print_exc()
+                myqueue.task_done_batch(len(workitems))
+                self.event_done(len(workitems))
+            with myqueue.mutex:
+                if myqueue._qsize() > 0:
+                    self.readyqueues.put_nowait(myqueue)
+                    continue
+                myqueue.scheduled = False
+            with self.idlecondition:
+                self.scheduledqueues -= 1
+                if self.scheduledqueues == 0:
+                    self.idlecondition.notify_all()
+
+    # Waits until the scheduled queues are handled, e.g. the drained ones, then stops the workers and the timer thread
+    def shutdown(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.idlecondition:
+            self.idlecondition.wait_for(lambda: self.scheduledqueues == 0, timeout)
+        self.timerwheel.stop()
+        for t in self.workers:
+            self.readyqueues.put_nowait(STOPQUEUE)
+        threads = self.workers if self.timerwheel.thread is None else self.workers + [self.timerwheel.thread]
+        return join_threads(threads, None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+class DiscreteEventQueue(BoundedQueue):
+    def __init__(self, executor, component, prioritized=False):
+        self.executor = executor
+        self.component = component
+        self.prioritized = prioritized
+        self.pending = 0
+        self.stopped = False
+        self.discarded = False  # the pending events of a queue that is stopped without drain are skipped
+        self.entries = deque()  # the scheduled entries of a bounded queue in FIFO order, for DROPOLDEST
+
+    def put_nowait(self, item):
+        self.put_later(item, 0)
+
+    def put_later(self, item, delay):
+        if self.stopped:
+            return
+        if self.capacity and self.pending >= self.capacity:
+            if self.policy == QueuePolicies.DROPNEWEST:
+                self.dropped += 1
+                return
+            if self.policy == QueuePolicies.DROPOLDEST:
+                self.discard_oldest()
+            else:
+                self.overflowed += 1
+        self.executor.schedule(delay, self, item)
+
+    # The entry stays in the event queue of the executor and is skipped when it is popped
+    def discard_oldest(self):
+        entry = self.entries.popleft()
+        while entry[4] is DISCARDED:
+            entry = self.entries.popleft()
+        entry[4] = DISCARDED
+        self.pending -= 1
+        self.dropped += 1
+
+    def entries_popped(self, entries):
+        for entry in entries:
+            entry[4] = DISCARDED
+        while self.entries and self.entries[0][4] is DISCARDED:
+            self.entries.popleft()
+
+    def stop(self, drain=False):
+        self.stopped = True
+        self.discarded = not drain
+
+    def task_done(self):
+        pass
+
+    def qsize(self):
+        return self.pending
+
+    def empty(self):
+        return self.pending == 0
+
+class DiscreteEventExecutor(Executor):
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+        self.eventqueue = []
+        self.sequence = itertools.count()  # breaks the ties of the events scheduled for the same virtual time in FIFO order
+        self.processedevents = 0
+
+    def create_queue(self, component, prioritized=False):
+        return DiscreteEventQueue(self, component, prioritized)
+
+    def time(self):
+        return self.now
+
+    def schedule(self, delay, myqueue, item):
+        myqueue.pending += 1
+        if myqueue.pending > myqueue.highwater:
+            myqueue.highwater = myqueue.pending
+        self.outstanding += 1
+        # The events of the same virtual time are ordered by their sequence, or by their aged priority in a
+        # prioritized queue
+        sequence = next(self.sequence)
+        key = sequence + item.priority.value * myqueue.component.agingwindow if myqueue.prioritized else sequence
+        entry = [self.now + delay, key, sequence, myqueue, item]
+        heapq.heappush(self.eventqueue, entry)
+        if myqueue.capacity:
+            myqueue.entries.append(entry)
+
+    # Handles the earliest event, returns False if there is no event left
+    def step(self):
+        if not self.eventqueue:
+            return False
+        with self.context_scope():
+            self.handle_next()
+        return True
+
+    # The events of the same queue that follow the earliest one at the same virtual time are handled in its batch
+    def handle_next(self):
+        entries = [heapq.heappop(self.eventqueue)]
+        eventtime, _, _, myqueue, _ = entries[0]
+        while (len(entries) < myqueue.component.batchsize and self.eventqueue and
+               self.eventqueue[0][0] == eventtime and self.eventqueue[0][3] is myqueue):
+            entries.append(heapq.heappop(self.eventqueue))
+        self.now = eventtime
+        workitems = [entry[4] for entry in entries if entry[4] is not DISCARDED]
+        myqueue.pending -= len(workitems)
+        self.outstanding -= len(entries)
+        if myqueue.capacity:
+            myqueue.entries_popped(entries)
+        if myqueue.discarded or not workitems:
+            return
+        for result in myqueue.component.handle_events(workitems):
+            run_coroutine(result)
+        self.processedevents += len(workitems)
+
+    # Runs until there is no event left, the virtual time passes until, maxevents events are handled or timeout seconds
+    # of wall clock time pass
+    def run(self, until=inf, maxevents=inf, timeout=None):
+        handled = 0
+        deadline = inf if timeout is None else time.monotonic() + timeout
+        with self.context_scope():
+            while self.eventqueue and handled < maxevents:
+                if self.eventqueue[0][0] > until:
+                    self.now = until
+                    break
+                self.handle_next()
+                handled += 1
+                if deadline != inf and time.monotonic() >= deadline:
+                    break
+        return handled
+
+    # The virtual time only passes while the executor runs, so waiting for quiescence runs the simulation to its end.
+    # Returns False if the events are not exhausted within the timeout
+    def wait_until_quiescent(self, timeout=None):
+        self.run(timeout=timeout)
+        return not self.eventqueue
+
+    async def wait_until_quiescent_async(self, timeout=None):
+        return self.wait_until_quiescent(timeout)
+
+    def pending_events(self, queues):
+        events = {myqueue: [] for myqueue in queues}
+        for entry in sorted(self.eventqueue):
+            if entry[4] is not DISCARDED and not entry[3].discarded and entry[3] in events:
+                events[entry[3]].append((entry[0] - self.now, entry[4]))
+        return events
+
+class AsyncioEventQueue(asyncio.Queue, BoundedQueue):
+    def __init__(self, executor, component, prioritized=False):
+        self.executor = executor
+        self.component = component
+        self.prioritized = prioritized
+        self.stopped = False
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._queue = create_container(self.component, self.prioritized)
+
+    # asyncio.Queue is not thread-safe, the events triggered from other threads are handed over to the event loop
+    def put_nowait(self, item):
+        if self.stopped:
+            return
+        self.executor.event_scheduled()
+        if self.executor.in_loop_thread():
+            self.put_in_loop(item)
+        else:
+            self.executor.loop.call_soon_threadsafe(self.put_in_loop, item)
+
+    def put_in_loop(self, item):
+        if self.capacity and self.qsize() >= self.capacity:
+            if self.policy == QueuePolicies.DROPNEWEST:
+                self.dropped += 1
+                self.executor.event_done()
+                return
+            if self.policy == QueuePolicies.DROPOLDEST:
+                pop_oldest(self._queue)
+                self.task_done()
+                self.dropped += 1
+                self.executor.event_done()
+            else:
+                self.overflowed += 1
+        super().put_nowait(item)
+        if self.qsize() > self.highwater:
+            self.highwater = self.qsize()
+
+    # Runs in the loop thread
+    def stop(self, drain=False, workers=0):
+        self.stopped = True
+        if not drain:
+            while not self.empty():
+                self.get_nowait()
+                self.task_done()
+                self.executor.event_done()
+        for i in range(workers):
+            super().put_nowait(STOPQUEUE)
+
+    def put_later(self, item, delay):
+        self.delayed += 1
+        self.executor.event_scheduled()
+        self.executor.call_later(delay, self.deliver_later, item)
+
+    def deliver_later(self, item):
+        self.delayed -= 1
+        self.put_nowait(item)
+        self.executor.event_done()
+
+    def pending_items(self):
+        return [(0, item) for item in self._queue if item is not STOPQUEUE]
+
+    # Takes the pending items that follow the first one up to maxitems or a sentinel
+    def get_batch_nowait(self, first, maxitems):
+        items = [first]
+        if first is not STOPQUEUE:
+            while len(items) < maxitems and self._queue and self._queue[0] is not STOPQUEUE:
+                items.append(self.get_nowait())
+        return items
+
+    def task_done_batch(self, count):
+        for i in range(count):
+            self.task_done()
+
+class AsyncioExecutor(Executor):
+    def __init__(self, loop=None):
+        super().__init__()
+        if loop is None:
+            loop = asyncio.new_event_loop()
+        self.loop = loop
+        self.loopthread = None
+        self.thread = None
+        self.queues = []
+        self.tasks = []
+        self.recordlocks = {}  # component -> the asyncio.Lock of a recorded component
+
+    def create_queue(self, component, prioritized=False):
+        myqueue = AsyncioEventQueue(self, component, prioritized)
+        self.queues.append(myqueue)
+        if self.loopthread is not None:
+            self.call_soon(self.start_queue_handlers, myqueue)
+        return myqueue
+
+    def time(self):
+        return self.loop.time()
+
+    # Until the loop is started the queues are only used by the thread that builds the topology
+    def in_loop_thread(self):
+        return self.loopthread is None or self.loopthread == threading.get_ident()
+
+    def call_soon(self, function, *args):
+        if self.in_loop_thread():
+            self.loop.call_soon(function, *args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def call_later(self, delay, function, *args):
+        if self.in_loop_thread():
+            self.loop.call_later(delay, function, *args)
+        else:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, function, *args)
+
+    def start_queue_handlers(self, myqueue):
+        for i in range(myqueue.component.num_worker_threads):
+            self.tasks.append(self.loop.create_task(self.queue_handler(myqueue)))
+
+    def stop_queue(self, myqueue, drain=False):
+        self.call_soon(myqueue.stop, drain, myqueue.component.num_worker_threads)
+
+    async def queue_handler(self, myqueue):
+        while True:
+            workitems = myqueue.get_batch_nowait(await myqueue.get(), myqueue.component.batchsize)
+            if workitems[0] is STOPQUEUE:
+                myqueue.task_done()
+                break
+            if myqueue.component.eventlog is None:
+                await self.handle_events(myqueue.component, workitems)
+            else:
+                async with self.record_lock(myqueue.component):
+                    await self.handle_events(myqueue.component, workitems)
+            myqueue.task_done_batch(len(workitems))
+            self.event_done(len(workitems))
+
+    async def handle_events(self, component, workitems):
+        try:
+            for result in component.handle_events(workitems):
+                if asyncio.iscoroutine(result):
+                    await result
+        except Exception:
+            traceback.print_exc()
+
+    # The tasks of a recorded component handle its batches one at a time, the lock of ComponentModel.record_events
+    # does not exclude them since they share the loop thread
+    def record_lock(self, component):
+        try:
+            return self.recordlocks[component]
+        except KeyError:
+            lock = self.recordlocks[component] = asyncio.Lock()
+            return lock
+
+    # Runs the event loop in the calling thread, forever or until the given coroutine completes
+    def run(self, coroutine=None):
+        self.loopthread = threading.get_ident()
+        asyncio.set_event_loop(self.loop)
+        for myqueue in self.queues:
+            self.start_queue_handlers(myqueue)
+        with self.context_scope():
+            if coroutine is None:
+                self.loop.run_forever()
+            else:
+                return self.loop.run_until_complete(coroutine)
+
+    # Runs the event loop in a background thread, e.g. while main.py waits for user commands
+    def start(self):
+        started = threading.Event()
+        self.loop.call_soon(started.set)
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        started.wait()
+
+    # Returns True if the handlers returned at their sentinels within the timeout, the others are cancelled
+    async def stop_handlers(self, timeout=None):
+        tasks = [task for task in self.tasks if not task.done()]
+        if not tasks:
+            return True
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return not pending
+
+    # Stops the event loop after the handlers, it cannot wait for them when it is called from a handler
+    def shutdown(self, timeout=None):
+        if self.loopthread is None:
+            return True
+        if self.in_loop_thread():
+            self.loop.create_task(self.stop_handlers(timeout)).add_done_callback(lambda task: self.loop.stop())
+            return False
+        stopped = asyncio.run_coroutine_threadsafe(self.stop_handlers(timeout), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(timeout)
+            stopped = stopped and not self.thread.is_alive()
+        return stopped
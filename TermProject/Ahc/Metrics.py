@@ -0,0 +1,126 @@
+import threading
+import time
+
+# The metrics of a component are the handling times and the queue waits of its events, counted per event type and
+# message type, and the depths of its queues. Metrics are enabled per simulation context by
+# ComponentRegistry.enable_metrics, the components only test their metrics attribute against None when they are off.
+# The times are kept in histograms of power of two buckets of nanoseconds, so the percentiles of a snapshot are upper
+# bounds that are at most twice the exact ones. The queue wait of an event is measured from the time it was put into
+# the queue of the component to the start of its handler, for a delayed message it includes the delay of the channel.
+
+BUCKETS = 64
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, ns, count=1):
+        ns = max(ns, 0)
+        self.count += count
+        self.total += ns * count
+        if ns > self.max:
+            self.max = ns
+        self.buckets[min(ns.bit_length(), BUCKETS - 1)] += count
+
+    # The upper bound of the bucket that holds the given fraction of the values, in nanoseconds
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << bucket) - 1, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {"count": self.count, "meanus": self.total / self.count / 1000.0 if self.count else 0.0,
+                "p50us": self.percentile(0.5) / 1000.0, "p99us": self.percentile(0.99) / 1000.0,
+                "maxus": self.max / 1000.0}
+
+def event_type_name(key):
+    event, messagetype = key
+    name = getattr(event, "name", str(event))
+    if messagetype is None:
+        return name
+    return f"{name}/{getattr(messagetype, 'name', messagetype)}"
+
+class ComponentMetrics:
+    def __init__(self, component):
+        self.component = component
+        self.lock = threading.Lock()  # a component may be handled by several workers at once
+        self.handling = {}
+        self.waiting = {}
+        self.busy = 0
+        self.first = None
+        self.last = None
+
+    # A batch of count events of the same type that was handled in duration nanoseconds starting at start
+    def handled(self, eventobjs, start, duration):
+        header = getattr(eventobjs[0].eventcontent, "header", None)
+        key = (eventobjs[0].event, None if header is None else header.messagetype)
+        with self.lock:
+            try:
+                handling = self.handling[key]
+                waiting = self.waiting[key]
+            except KeyError:
+                handling = self.handling[key] = Histogram()
+                waiting = self.waiting[key] = Histogram()
+            handling.add(duration // len(eventobjs), len(eventobjs))
+            for eventobj in eventobjs:
+                waiting.add(start - eventobj.enqueued)
+            self.busy += duration
+            if self.first is None:
+                self.first = start
+            self.last = start + duration
+
+    def reset(self):
+        with self.lock:
+            self.handling.clear()
+            self.waiting.clear()
+            self.busy = 0
+            self.first = None
+            self.last = None
+        for myqueue in self.component.queues:
+            myqueue.highwater = myqueue.qsize()
+
+    # The events per second and the utilization are taken over the time from the first handled event to now
+    def snapshot(self):
+        with self.lock:
+            elapsed = 0 if self.first is None else time.monotonic_ns() - self.first
+            count = sum(histogram.count for histogram in self.handling.values())
+            snapshot = {
+                "events": count,
+                "eventspersecond": count * 1e9 / elapsed if elapsed else 0.0,
+                "utilization": self.busy / elapsed if elapsed else 0.0,
+                "handling": {event_type_name(key): histogram.snapshot() for key, histogram in self.handling.items()},
+                "waiting": {event_type_name(key): histogram.snapshot() for key, histogram in self.waiting.items()},
+            }
+        snapshot["queues"] = [{"depth": myqueue.qsize(), "highwater": myqueue.highwater, "capacity": myqueue.capacity,
+                               "dropped": myqueue.dropped, "overflowed": myqueue.overflowed}
+                              for myqueue in self.component.queues]
+        snapshot["failedevents"] = self.component.failedevents
+        if hasattr(self.component, "droppedmessages"):
+            snapshot["droppedmessages"] = self.component.droppedmessages
+        if hasattr(self.component, "transmittedbytes"):
+            snapshot["transmittedbytes"] = self.component.transmittedbytes
+        return snapshot
+
+# Prints the busiest components first, with their event types by total handling time
+def print_metrics(snapshots, limit=None):
+    rows = sorted(snapshots.items(), key=lambda item: item[1]["utilization"], reverse=True)
+    print(f"{'component':<32}{'events':>8}{'ev/s':>10}{'busy':>7}{'highwater':>11}{'dropped':>9}")
+    for key, snapshot in rows[:limit]:
+        highwater = max((myqueue["highwater"] for myqueue in snapshot["queues"]), default=0)
+        dropped = sum(myqueue["dropped"] for myqueue in snapshot["queues"]) + snapshot.get("droppedmessages", 0)
+        print(f"{key:<32}{snapshot['events']:>8}{snapshot['eventspersecond']:>10.1f}"
+              f"{snapshot['utilization']:>7.1%}{highwater:>11}{dropped:>9}")
+        handling = sorted(snapshot["handling"].items(), key=lambda item: item[1]["meanus"] * item[1]["count"],
+                          reverse=True)
+        for name, histogram in handling:
+            waiting = snapshot["waiting"][name]
+            print(f"    {name:<40}{histogram['count']:>8} handle p50 {histogram['p50us']:.1f}us "
+                  f"p99 {histogram['p99us']:.1f}us max {histogram['maxus']:.1f}us, "
+                  f"wait p50 {waiting['p50us']:.1f}us p99 {waiting['p99us']:.1f}us")
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from collections import Counter, deque
+
+from Ahc.Executors import DiscreteEventExecutor, DiscreteEventQueue, inf, run_coroutine
+
+# An event log records the order in which the components handle their events in a run on any executor, together with
+# the user inputs, and the ReplayExecutor handles the same events in the same order in a single thread. A run is
+# replayed exactly if the context has the same seed, the topology is constructed the same way and the inputs are given
+# at the same positions of the log, so the handlers of a component draw the same random numbers and create the same
+# events in the same order.
+# An event is identified by its origin, the component that created it and the number of events it created before. The
+# events from outside of the handlers have no origin, they are matched by their types in FIFO order.
+# Every batch of events given to handle_events is a record, so the batch handlers get the same batches.
+
+def component_key(component):
+    return component.componentname + str(component.componentinstancenumber)
+
+def event_identity(eventobj):
+    header = getattr(eventobj.eventcontent, "header", None)
+    return eventobj.origin, str(eventobj.event), str(None if header is None else header.messagetype)
+
+class EventLog:
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.records = []  # (component key, [event identity, ...])
+        self.inputs = []  # (number of records before the input, input)
+        self.lock = threading.Lock()
+        self.context = None
+
+    # Records the events of the components of the context and the ones that are created later, the log has to be
+    # attached before the topology is constructed
+    def attach(self, context=None):
+        if context is None:
+            from Ahc.Ahc import current_context
+            context = current_context()
+        self.context = context
+        context.eventlog = self
+        for component in context.registry.components.values():
+            component.eventlog = self
+
+    def detach(self):
+        self.context.eventlog = None
+        for component in self.context.registry.components.values():
+            component.eventlog = None
+
+    def record(self, component, workitems):
+        record = (component_key(component), [event_identity(workitem) for workitem in workitems])
+        with self.lock:
+            self.records.append(record)
+
+    def record_input(self, userinput):
+        with self.lock:
+            self.inputs.append((len(self.records), userinput))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"seed": self.seed, "records": self.records, "inputs": self.inputs}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        eventlog = cls(data["seed"])
+        eventlog.records = [(key, [(None if origin is None else tuple(origin), event, messagetype)
+                                   for origin, event, messagetype in identities])
+                            for key, identities in data["records"]]
+        eventlog.inputs = [tuple(item) for item in data["inputs"]]
+        return eventlog
+
+# A replayed queue does not apply its capacity, the events that were dropped in the recorded run are never handled
+class ReplayEventQueue(DiscreteEventQueue):
+    def put_later(self, item, delay):
+        if not self.stopped:
+            self.executor.schedule(delay, self, item)
+
+class ReplayExecutor(DiscreteEventExecutor):
+    def __init__(self, eventlog: EventLog):
+        super().__init__()
+        self.eventlog = eventlog
+        self.position = 0  # the number of records replayed
+        self.pendingentries = {}  # (component key, event identity) -> the scheduled entries in FIFO order
+        self.replayedlog = EventLog(eventlog.seed)  # equals the replayed log if the replay is exact
+
+    # The components need an event log to give their events origins, the replay is recorded as well
+    def create_queue(self, component, prioritized=False):
+        if component.eventlog is None:
+            component.eventlog = self.replayedlog
+        return ReplayEventQueue(self, component, prioritized)
+
+    def schedule(self, delay, myqueue, item):
+        myqueue.pending += 1
+        if myqueue.pending > myqueue.highwater:
+            myqueue.highwater = myqueue.pending
+        self.outstanding += 1
+        entry = [self.now + delay, 0, next(self.sequence), myqueue, item]
+        key = (component_key(myqueue.component), event_identity(item))
+        try:
+            self.pendingentries[key].append(entry)
+        except KeyError:
+            self.pendingentries[key] = deque([entry])
+
+    def finished(self):
+        return self.position == len(self.eventlog.records)
+
+    # Handles the events of the next record, returns False if the log is finished, one of its events has not been
+    # triggered yet, e.g. it comes from an input that is not given yet, or its virtual time is after until
+    def handle_next(self, until=inf):
+        if self.finished():
+            return False
+        key, identities = self.eventlog.records[self.position]
+        counts = Counter(identities)
+        for identity, count in counts.items():
+            if len(self.pendingentries.get((key, identity), ())) < count:
+                return False
+        if max(self.pendingentries[(key, identity)][count - 1][0] for identity, count in counts.items()) > until:
+            return False
+        entries = [self.pendingentries[(key, identity)].popleft() for identity in identities]
+        self.position += 1
+        self.now = max(self.now, max(entry[0] for entry in entries))
+        myqueue = entries[0][3]
+        for entry in entries:
+            entry[3].pending -= 1
+        self.outstanding -= len(entries)
+        if myqueue.discarded:
+            return True
+        for result in myqueue.component.handle_events([entry[4] for entry in entries]):
+            run_coroutine(result)
+        self.processedevents += len(entries)
+        return True
+
+    def step(self):
+        with self.context_scope():
+            return self.handle_next()
+
+    def run(self, until=inf, maxevents=inf):
+        handled = 0
+        with self.context_scope():
+            while handled < maxevents and self.handle_next(until):
+                handled += 1
+        return handled
+
+    # Replays until the next record cannot be replayed, returns False if the timeout expires first
+    def wait_until_quiescent(self, timeout=None):
+        deadline = inf if timeout is None else time.monotonic() + timeout
+        with self.context_scope():
+            while self.handle_next():
+                if deadline != inf and time.monotonic() >= deadline:
+                    return False
+        return True
+
+    # Replays the records before the given position of the log, e.g. the position of the next input
+    def run_to(self, position):
+        return self.run(maxevents=position - self.position)
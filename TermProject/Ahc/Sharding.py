@@ -0,0 +1,178 @@
+import itertools
+import multiprocessing
+import operator
+import queue
+import threading
+import time
+from enum import Enum
+
+import networkx as nx
+from networkx.algorithms.community import kernighan_lin_bisection
+
+from Ahc.Ahc import ComponentRegistry, ConnectorTypes, Event, Topology
+
+# A sharded simulation partitions the topology over processes so that the components of different shards do not
+# share the GIL. Every shard process constructs its own nodes and the channels that have at least one local endpoint.
+# The remote endpoint of a channel is a RemoteComponent that forwards the delivered events to the inbox of the
+# process that owns the node, where they are triggered on the node as if the channel delivered them locally.
+# Shards must use an executor that runs in real time, there is no synchronization of virtual times between processes.
+# The simulation is quiescent when every shard is quiescent and no event is on its way between them: the shards count
+# the events they send and receive over the cut, and two rounds of counts that find all shards quiescent with the same
+# totals of sent and received events prove that none was in flight in between.
+
+class ShardMessageTypes(Enum):
+    EVENT = "event"
+    CALL = "call"
+    COUNT = "count"
+
+# Splits the largest part by Kernighan-Lin bisection until there are numshards parts, every bisection minimizes the
+# number of links between its halves
+def partition_graph(G: nx.Graph, numshards, seed=None):
+    parts = [set(G.nodes)]
+    while len(parts) < numshards:
+        parts.sort(key=len)
+        largest = parts.pop()
+        if len(largest) < 2:
+            parts.append(largest)
+            break
+        unweighted = nx.Graph(G.subgraph(largest).edges())  # edge weights are link costs, not traffic
+        unweighted.add_nodes_from(largest)
+        parts.extend(kernighan_lin_bisection(unweighted, seed=seed))
+    return {node: shard for shard, part in enumerate(parts) for node in part}
+
+class RemoteComponent:
+    sentevents = 0  # the events that this process sent to the other shards
+    sentlock = threading.Lock()
+
+    def __init__(self, componentname, componentinstancenumber, inbox=None):
+        self.componentname = componentname
+        self.componentinstancenumber = componentinstancenumber
+        self.inbox = inbox
+
+    # Events are pickled to the other process, the event source is replaced by its name and instance number
+    def trigger_event(self, eventobj: Event):
+        source = eventobj.eventsource
+        with RemoteComponent.sentlock:
+            RemoteComponent.sentevents += 1
+        self.inbox.put((ShardMessageTypes.EVENT, self.componentinstancenumber, eventobj.event, eventobj.eventcontent,
+                        eventobj.fromchannel, source.componentname, source.componentinstancenumber))
+
+def construct_shard(topology: Topology, G: nx.Graph, nodetype, channeltype, assignment, shard, inboxes):
+    topology.shards = None  # a forked shard inherits the topology of the parent
+    topology.G = G
+    for i in G.nodes:
+        if assignment[i] == shard:
+            topology.nodes[i] = nodetype(nodetype.__name__, i)
+    for k in G.edges:
+        if assignment[k[0]] != shard and assignment[k[1]] != shard:
+            continue
+        ch = channeltype(channeltype.__name__, str(k[0]) + "-" + str(k[1]), G.edges[k[0], k[1]]['weight'])
+        topology.channels[k] = ch
+        for i in k:
+            if assignment[i] == shard:
+                topology.nodes[i].connect_me_to_channel(ConnectorTypes.DOWN, ch)
+            else:
+                remote = RemoteComponent(nodetype.__name__, i, inboxes[assignment[i]])
+                ch.connect_me_to_component(remote.componentname + str(i), remote)
+
+def run_shard(G, nodetype, channeltype, assignment, shard, inboxes, replies, executortype):
+    if executortype is not None:
+        ComponentRegistry().set_executor(executortype())
+    topology = Topology()
+    construct_shard(topology, G, nodetype, channeltype, assignment, shard, inboxes)
+    topology.start()
+
+    inbox = inboxes[shard]
+    received = 0
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        if message[0] == ShardMessageTypes.COUNT:
+            with RemoteComponent.sentlock:
+                sent = RemoteComponent.sentevents
+            replies.put((message[1], sent, received, topology.context.wait_until_quiescent(0)))
+            continue
+        received += 1
+        if message[0] == ShardMessageTypes.EVENT:
+            _, target, event, eventcontent, fromchannel, sourcename, sourceinstancenumber = message
+            source = RemoteComponent(sourcename, sourceinstancenumber)
+            topology.nodes[target].trigger_event(Event(source, event, eventcontent, fromchannel))
+        elif message[0] == ShardMessageTypes.CALL:
+            _, target, method, args = message
+            operator.attrgetter(method)(topology.nodes[target])(*args)
+    topology.context.registry.terminate()
+
+class ShardedSimulation:
+    def __init__(self, G: nx.Graph, nodetype, channeltype, numshards, executortype=None, seed=None):
+        self.G = G
+        self.numshards = numshards
+        self.assignment = partition_graph(G, numshards, seed)
+        context = multiprocessing.get_context()
+        self.inboxes = [context.Queue() for i in range(numshards)]
+        self.replies = context.Queue()
+        self.sentcalls = 0
+        self.rounds = itertools.count()
+        self.processes = [context.Process(target=run_shard, args=(G, nodetype, channeltype, self.assignment, shard,
+                                                                   self.inboxes, self.replies, executortype),
+                                          daemon=True)
+                          for shard in range(numshards)]
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+
+    # Calls a method of a node in the process of its shard, e.g. call_node(0, "MSTComponent.startMST")
+    def call_node(self, nodeid, method, *args):
+        self.sentcalls += 1
+        self.inboxes[self.assignment[nodeid]].put((ShardMessageTypes.CALL, nodeid, method, args))
+
+    # The quiescent flag and the totals of sent and received events of all shards, None if a shard does not answer
+    # before the deadline. The late answers to an earlier round are skipped
+    def count_events(self, deadline):
+        countround = next(self.rounds)
+        for inbox in self.inboxes:
+            inbox.put((ShardMessageTypes.COUNT, countround))
+        counts = []
+        while len(counts) < self.numshards:
+            try:
+                count = self.replies.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None
+            if count[0] == countround:
+                counts.append(count)
+        quiescent = all(count[3] for count in counts)
+        return quiescent, self.sentcalls + sum(count[1] for count in counts), sum(count[2] for count in counts)
+
+    # Returns False if the timeout expires before the shards are quiescent
+    def wait_until_quiescent(self, timeout=None, interval=0.01):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        previous = None
+        while True:
+            counts = self.count_events(deadline)
+            if counts is None:
+                return False
+            quiescent, sent, received = counts
+            if quiescent and sent == received:
+                if previous == (sent, received):
+                    return True
+                previous = (sent, received)
+            else:
+                previous = None
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+
+    def get_cut_size(self):
+        return sum(1 for u, v in self.G.edges if self.assignment[u] != self.assignment[v])
+
+    def join(self, timeout=None):
+        for p in self.processes:
+            p.join(timeout)
+
+    # Returns True if all shard processes exited within the timeout
+    def stop(self, timeout=None):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        self.join(timeout)
+        return not any(p.is_alive() for p in self.processes)
@@ -0,0 +1,192 @@
+import argparse
+import itertools
+import json
+import mmap
+import struct
+import threading
+import time
+from enum import Enum
+
+import numpy as np
+
+from Ahc.Ahc import message_size
+
+# The tracer records the events that are triggered on components and handled by them into a preallocated ring buffer
+# of fixed size binary records, in memory or in a memory-mapped file. Tracing is enabled per simulation context by
+# Tracer.attach, the components only test their tracer attribute against None when tracing is off.
+# Components, event types and message types are stored as ids, their names are saved to the .json file beside the
+# trace. The trace can be analysed offline: python -m Ahc.Tracing trace.bin [--plot spacetime.png]
+# A record carries the time the event was put into the queue of the component, a record of a handled event also the
+# time its handler started and its duration, so the queue wait is taken from the record itself. An event that is put
+# again, e.g. forwarded or sent to itself, is stamped at every put. The events that a component puts into its own
+# queues, e.g. between the pipeline stages of a channel, are stamped when they are created. A pass-through layer
+# forwards the events without a record, they are recorded by the components it forwards them to.
+
+class TraceRecordTypes(Enum):
+    TRIGGER = 1
+    HANDLE = 2
+
+RECORD = struct.Struct("<B3xIIHHIQqqq")
+RECORDTYPE = np.dtype([('kind', 'u1'), ('pad', 'V3'), ('source', '<u4'), ('destination', '<u4'), ('event', '<u2'),
+                       ('messagetype', '<u2'), ('size', '<u4'), ('sequence', '<u8'), ('time', '<i8'),
+                       ('eventtime', '<i8'), ('duration', '<i8')])
+HEADER = struct.Struct("<8sII")
+MAGIC = b"AHCTRACE"
+
+def component_name(component):
+    if component is None:
+        return "external"
+    try:
+        return f"{component.componentname}.{component.componentinstancenumber}"
+    except AttributeError:
+        return type(component).__name__
+
+class Tracer:
+    def __init__(self, capacity=1 << 20, path=None):
+        self.capacity = capacity
+        self.path = path
+        self.sequence = itertools.count(1)  # 0 marks an empty slot
+        self.lock = threading.Lock()
+        self.names = {"components": [], "events": [], "messagetypes": [""]}
+        self.ids = {"components": {}, "events": {}, "messagetypes": {None: 0}}
+        self.context = None
+        if path is None:
+            self.file = None
+            self.buffer = bytearray(HEADER.size + capacity * RECORD.size)
+        else:
+            self.file = open(path, "w+b")
+            self.file.truncate(HEADER.size + capacity * RECORD.size)
+            self.buffer = mmap.mmap(self.file.fileno(), 0)
+        HEADER.pack_into(self.buffer, 0, MAGIC, RECORD.size, capacity)
+
+    # Enables tracing for the components of the context and the ones that are created later
+    def attach(self, context=None):
+        if context is None:
+            from Ahc.Ahc import current_context
+            context = current_context()
+        self.context = context
+        context.tracer = self
+        for component in context.registry.components.values():
+            component.tracer = self
+
+    def detach(self):
+        self.context.tracer = None
+        for component in self.context.registry.components.values():
+            component.tracer = None
+
+    # Names are added under the lock, a lookup that hits does not need it
+    def get_id(self, table, key, name):
+        try:
+            return self.ids[table][key]
+        except KeyError:
+            with self.lock:
+                if key not in self.ids[table]:
+                    self.ids[table][key] = len(self.names[table])
+                    self.names[table].append(name)
+                return self.ids[table][key]
+
+    def record(self, kind, source, destination, eventobj, now, duration):
+        header = getattr(eventobj.eventcontent, "header", None)
+        messagetype = None if header is None else header.messagetype
+        sequence = next(self.sequence)
+        RECORD.pack_into(self.buffer, HEADER.size + (sequence - 1) % self.capacity * RECORD.size, kind.value,
+                         self.get_id("components", source, component_name(source)),
+                         self.get_id("components", destination, component_name(destination)),
+                         self.get_id("events", eventobj.event, str(eventobj.event)),
+                         self.get_id("messagetypes", messagetype, str(messagetype)),
+                         message_size(eventobj.eventcontent), sequence, now, eventobj.enqueued, duration)
+
+    def trigger(self, component, eventobj):
+        self.record(TraceRecordTypes.TRIGGER, eventobj.eventsource, component, eventobj, time.monotonic_ns(), 0)
+
+    def handled(self, component, eventobj, start, duration):
+        self.record(TraceRecordTypes.HANDLE, eventobj.eventsource, component, eventobj, start, duration)
+
+    def save(self, path=None):
+        path = self.path if path is None else path
+        if self.file is None:
+            with open(path, "wb") as f:
+                f.write(self.buffer)
+        else:
+            self.buffer.flush()
+        with open(path + ".json", "w") as f:
+            json.dump(self.names, f)
+
+    def close(self):
+        if self.file is not None:
+            self.save()
+            self.buffer.close()
+            self.file.close()
+            self.file = None
+
+class Trace:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, recordsize, capacity = HEADER.unpack_from(data)
+        if magic != MAGIC or recordsize != RECORDTYPE.itemsize:
+            raise ValueError(f"{path} is not a trace")
+        records = np.frombuffer(data, RECORDTYPE, capacity, HEADER.size)
+        self.records = np.sort(records[records['sequence'] > 0], order='sequence')
+        with open(path + ".json") as f:
+            self.names = json.load(f)
+        self.triggers = self.records[self.records['kind'] == TraceRecordTypes.TRIGGER.value]
+        self.handles = self.records[self.records['kind'] == TraceRecordTypes.HANDLE.value]
+
+    def summary(self):
+        waits = (self.handles['time'] - self.handles['eventtime']) / 1000.0
+        durations = self.handles['duration'] / 1000.0
+        components = np.array([name.split(".")[0] for name in self.names["components"]])
+        keys = np.stack([self.handles['destination'], self.handles['event']], axis=1)
+        print(f"{len(self.records)} records, latencies in microseconds")
+        print(f"{'component':<24}{'event':<40}{'count':>8}{'wait p50':>12}{'wait p99':>12}{'handle p50':>12}"
+              f"{'handle p99':>12}{'bytes':>14}")
+        groups = {}
+        for i, (destination, event) in enumerate(keys):
+            groups.setdefault((components[destination], self.names["events"][event]), []).append(i)
+        for (component, event), indices in sorted(groups.items()):
+            print(f"{component:<24}{event:<40}{len(indices):>8}{np.percentile(waits[indices], 50):>12.1f}"
+                  f"{np.percentile(waits[indices], 99):>12.1f}{np.percentile(durations[indices], 50):>12.1f}"
+                  f"{np.percentile(durations[indices], 99):>12.1f}{int(self.handles['size'][indices].sum()):>14}")
+
+    # A lane per component, or per node if the components are grouped by their instance numbers
+    def plot(self, path, bynode=False):
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+
+        names = self.names["components"]
+        lanenames = sorted({name.rsplit(".", 1)[-1] if bynode else name for name in names})
+        laneindex = {name: i for i, name in enumerate(lanenames)}
+        lanes = np.array([laneindex[name.rsplit(".", 1)[-1] if bynode else name] for name in names])
+        start = self.records['time'].min() if len(self.records) else 0
+        triggered = (self.handles['eventtime'] - start) / 1e6
+        handled = (self.handles['time'] - start) / 1e6
+        sources = lanes[self.handles['source']]
+        destinations = lanes[self.handles['destination']]
+        messages = sources != destinations
+
+        fig, ax = plt.subplots(figsize=(12, max(4, len(lanenames) * 0.3)))
+        segments = np.stack([np.stack([triggered, sources], axis=1), np.stack([handled, destinations], axis=1)],
+                            axis=1)[messages]
+        ax.add_collection(LineCollection(segments, linewidths=0.5, alpha=0.6))
+        ax.scatter(handled, destinations, s=4, c='k')
+        ax.set_yticks(range(len(lanenames)))
+        ax.set_yticklabels(lanenames, fontsize=6)
+        ax.set_xlabel("time (ms)")
+        ax.autoscale()
+        fig.tight_layout()
+        fig.savefig(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarizes an AHC event trace and draws its space-time diagram")
+    parser.add_argument("trace")
+    parser.add_argument("--plot", help="the file to save the space-time diagram to")
+    parser.add_argument("--bynode", action="store_true", help="a lane per node instead of per component")
+    args = parser.parse_args(argv)
+    trace = Trace(args.trace)
+    trace.summary()
+    if args.plot:
+        trace.plot(args.plot, args.bynode)
+
+if __name__ == "__main__":
+    main()
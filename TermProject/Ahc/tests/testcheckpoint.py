@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+import networkx as nx
+
+from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, SimulationContext, \
+  Topology
+from Ahc.Channels import Channel, ChannelEventTypes
+from Ahc.Checkpoint import load_checkpoint_graph, save_checkpoint
+from Ahc.Executors import DiscreteEventExecutor
+
+# A checkpoint saved in the middle of a run on the discrete event executor, with deliveries delayed by the channels
+# still pending, is resumed in a fresh simulation that makes the same deliveries at the same virtual times
+
+HOPS = 4
+
+class DelayChannel(Channel):
+  def on_process_in_channel(self, eventobj: Event):
+    myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent)
+    self.outputqueue.put_later(myevent, self.random.uniform(0.1, 1.0))
+
+  def __init__(self, componentname, componentinstancenumber, weight=1):
+    super().__init__(componentname, componentinstancenumber)
+
+class Gossip(ComponentModel):
+  def on_init(self, eventobj: Event):
+    if self.componentinstancenumber == 0:
+      self.gossip(0)
+
+  def on_message_from_bottom(self, eventobj: Event):
+    hops = eventobj.eventcontent.payload
+    self.deliveries.append((round(self.executor.time(), 9), hops))
+    if hops < HOPS:
+      self.gossip(hops + 1)
+
+  def gossip(self, hops):
+    header = GenericMessageHeader("GOSSIP", self.componentinstancenumber, -1)
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, hops)))
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.deliveries = []
+
+def deliveries(topo):
+  return {i: node.deliveries for i, node in topo.nodes.items()}
+
+def test_resume_pending_deliveries():
+  G = nx.cycle_graph(6)
+  nx.set_edge_attributes(G, 1, 'weight')
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "checkpoint.npz")
+    executor = DiscreteEventExecutor()
+    with SimulationContext(executor, seed=7) as context:
+      topo = Topology()
+      topo.construct_from_graph(G, Gossip, DelayChannel)
+      topo.start()
+      executor.run(until=1.5)
+      pending = executor.pending_events([myqueue for cmp in context.registry.components.values()
+                                         for myqueue in cmp.queues])
+      assert any(delay > 0 for events in pending.values() for delay, _ in events)
+      before = {i: list(node_deliveries) for i, node_deliveries in deliveries(topo).items()}
+      save_checkpoint(path, context)
+      executor.run()
+      expected = deliveries(topo)
+    assert expected != before
+
+    seed, graph = load_checkpoint_graph(path)
+    assert seed == 7
+    executor = DiscreteEventExecutor()
+    with SimulationContext(executor, seed=seed) as context:
+      topo = Topology()
+      topo.construct_from_graph(graph, Gossip, DelayChannel)
+      topo.resume(path)
+      assert executor.now == 1.5
+      assert deliveries(topo) == before
+      executor.run()
+      assert deliveries(topo) == expected
+
+def main():
+  test_resume_pending_deliveries()
+  print("Checkpoint tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,87 @@
+import networkx as nx
+
+from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, SimulationContext, \
+  Topology
+from Ahc.Channels import Channel
+from Ahc.Clocks import MINDELTA
+from Ahc.Executors import DiscreteEventExecutor
+
+# A token is flooded along a chain of more processes than MINDELTA, so the clocks at its end fold their deltas into
+# new bases. A second token is flooded on a separate pair of nodes, its events are concurrent with the ones of the chain
+
+CHAIN = 2 * MINDELTA
+
+class WeightedChannel(Channel):
+  def __init__(self, componentname, componentinstancenumber, weight=1):
+    super().__init__(componentname, componentinstancenumber)
+
+class Relay(ComponentModel):
+  def on_init(self, eventobj: Event):
+    if self.componentinstancenumber in (0, CHAIN):
+      self.forward(eventobj)
+
+  def on_message_from_bottom(self, eventobj: Event):
+    if self.stamp is None:
+      self.forward(eventobj)
+
+  def forward(self, eventobj: Event):
+    self.stamp = self.clock.stamp()
+    header = GenericMessageHeader("TOKEN", self.componentinstancenumber, -1)
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, None)))
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.stamp = None
+
+def create(executor, context):
+  G = nx.disjoint_union(nx.path_graph(CHAIN), nx.path_graph(2))
+  nx.set_edge_attributes(G, 1, "weight")
+  context.registry.enable_clocks()
+  topo = Topology()
+  topo.construct_from_graph(G, Relay, WeightedChannel)
+  topo.start()
+  executor.run()
+  return topo
+
+def test_happened_before_along_chain():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = create(executor, context)
+    stamps = [topo.nodes[i].stamp for i in range(CHAIN)]
+    assert all(stamp is not None for stamp in stamps)
+    assert topo.nodes[CHAIN - 1].clock.version > 0
+    for i in range(CHAIN):
+      for j in range(CHAIN):
+        assert stamps[i].happened_before(stamps[j]) == (i < j), (i, j)
+    last = stamps[-1].as_dict()
+    assert all(last[topo.nodes[i].clock.process] > 0 for i in range(CHAIN))
+
+def test_concurrent_tokens():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = create(executor, context)
+    pair = [topo.nodes[CHAIN].stamp, topo.nodes[CHAIN + 1].stamp]
+    assert pair[0].happened_before(pair[1])
+    for i in range(CHAIN):
+      for stamp in pair:
+        assert topo.nodes[i].stamp.concurrent(stamp), i
+        assert stamp.concurrent(topo.nodes[i].stamp), i
+
+def test_critical_path_length():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = create(executor, context)
+    longest = max(cmp.clock.lamport for cmp in context.registry.components.values())
+    assert context.registry.critical_path_length() == longest
+    # every hop of the chain adds at least the send, the channel and the receive to the causal chain
+    assert longest >= 3 * (CHAIN - 1)
+    assert longest > max(topo.nodes[i].clock.lamport for i in (CHAIN, CHAIN + 1))
+
+def main():
+  test_happened_before_along_chain()
+  test_concurrent_tokens()
+  test_critical_path_length()
+  print("Clock tests passed")
+
+if __name__ == "__main__":
+  main()
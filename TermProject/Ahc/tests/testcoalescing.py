@@ -0,0 +1,79 @@
+from Ahc.Ahc import ComponentModel, ConnectorTypes, Event, EventPriorities, EventTypes, GenericMessage, \
+  GenericMessageHeader, SimulationContext
+from Ahc.Channels import P2PFIFOPerfectChannel
+from Ahc.Executors import DiscreteEventExecutor
+
+# The receiver of a coalesced batch gets its messages in one call of its batch handler, in the order they were sent
+# within their priority class
+
+class UrgentChannel(P2PFIFOPerfectChannel):
+  prioritized = True
+
+  def coalesces(self, eventobj: Event):
+    return eventobj.eventcontent.payload != "urgent"
+
+class Sender(ComponentModel):
+  def on_init(self, eventobj: Event):
+    pass
+
+  def send(self, payload, priority=EventPriorities.NORMAL):
+    header = GenericMessageHeader("DATA", 0, 1, 1, "0-1")
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, payload), priority=priority))
+
+class Receiver(ComponentModel):
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_batch_from_bottom(self, eventobjs):
+    self.calls.append([eventobj.eventcontent.payload for eventobj in eventobjs])
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.calls = []
+    self.batchhandlers[EventTypes.MFRB] = self.on_batch_from_bottom
+
+def send_over(window, messages):
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    UrgentChannel.coalescewindow = window
+    try:
+      sender = Sender("Sender", 0)
+      receiver = Receiver("Receiver", 1)
+      channel = UrgentChannel("UrgentChannel", "0-1")
+      sender.connect_me_to_channel(ConnectorTypes.DOWN, channel)
+      receiver.connect_me_to_channel(ConnectorTypes.DOWN, channel)
+      context.registry.init()
+      executor.run()
+      for payload, priority in messages:
+        sender.send(payload, priority)
+      executor.run()
+    finally:
+      UrgentChannel.coalescewindow = 0.0
+    return receiver.calls, context.coalescing
+
+def test_batch_in_one_call():
+  calls, coalescing = send_over(0.01, [(i, EventPriorities.NORMAL) for i in range(10)])
+  assert calls == [list(range(10))]
+  assert coalescing
+
+def test_order_within_priority_class():
+  messages = [(i, EventPriorities.NORMAL) for i in range(5)] + [("urgent", EventPriorities.HIGH)] + \
+             [(i, EventPriorities.NORMAL) for i in range(5, 10)]
+  calls, coalescing = send_over(0.01, messages)
+  received = [payload for call in calls for payload in call]
+  assert received[0] == "urgent"
+  assert [payload for payload in received if payload != "urgent"] == list(range(10))
+
+def test_no_batches_without_window():
+  calls, coalescing = send_over(0.0, [(i, EventPriorities.NORMAL) for i in range(10)])
+  assert [payload for call in calls for payload in call] == list(range(10))
+  assert not coalescing
+
+def main():
+  test_batch_in_one_call()
+  test_order_within_priority_class()
+  test_no_batches_without_window()
+  print("Coalescing tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from Ahc.Ahc import ComponentModel, Event, SimulationContext
+from Ahc.Executors import DiscreteEventExecutor
+
+# The discrete event executor handles the events in the order of their virtual times, the events of the same time in
+# the order they were put, and the virtual time only passes while it runs
+
+class Recorder(ComponentModel):
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_tick(self, eventobj: Event):
+    self.log.append((self.executor.time(), self.componentinstancenumber, eventobj.eventcontent))
+    delay = eventobj.eventcontent[1]
+    if delay:
+      self.peer.inputqueue.put_later(Event(self, "tick", (eventobj.eventcontent[0] + "'", 0)), delay)
+
+  def __init__(self, componentname, componentinstancenumber, log):
+    super().__init__(componentname, componentinstancenumber)
+    self.log = log
+    self.eventhandlers["tick"] = self.on_tick
+
+def create(log):
+  first, second = Recorder("Recorder", 0, log), Recorder("Recorder", 1, log)
+  first.peer, second.peer = second, first
+  return first, second
+
+def test_virtual_time_order():
+  executor = DiscreteEventExecutor()
+  log = []
+  with SimulationContext(executor):
+    first, second = create(log)
+    for name, delay, component, replydelay in (("c", 3.0, first, 0.5), ("a", 1.0, second, 0), ("d", 3.0, second, 0),
+                                               ("b", 1.0, first, 2.0), ("e", 5.0, first, 0)):
+      component.inputqueue.put_later(Event(None, "tick", (name, replydelay)), delay)
+    executor.run()
+  assert [(now, number, name) for now, number, (name, delay) in log] == \
+         [(1.0, 1, "a"), (1.0, 0, "b"), (3.0, 0, "c"), (3.0, 1, "d"), (3.0, 1, "b'"), (3.5, 1, "c'"), (5.0, 0, "e")]
+  assert executor.time() == 5.0
+  assert executor.processedevents == 7
+
+def test_run_until():
+  executor = DiscreteEventExecutor()
+  log = []
+  with SimulationContext(executor):
+    first, second = create(log)
+    for i in range(10):
+      first.inputqueue.put_later(Event(None, "tick", (str(i), 0)), i + 1.0)
+    assert executor.run(until=4.5) == 4
+    assert executor.time() == 4.5
+    assert executor.run(maxevents=2) == 2
+    assert executor.time() == 6.0
+    executor.run()
+  assert [name for now, number, (name, delay) in log] == [str(i) for i in range(10)]
+  assert [now for now, number, content in log] == [i + 1.0 for i in range(10)]
+
+class Looper(ComponentModel):
+  def on_init(self, eventobj: Event):
+    self.send_self(Event(self, "loop", None))
+
+  def on_loop(self, eventobj: Event):
+    self.inputqueue.put_later(Event(self, "loop", None), 1.0)
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.eventhandlers["loop"] = self.on_loop
+
+# A protocol that never goes idle does not hold the caller beyond the timeout
+def test_wait_until_quiescent_timeout():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    Looper("Looper", 0)
+    context.registry.init()
+    start = time.monotonic()
+    assert not context.wait_until_quiescent(0.2)
+    assert not asyncio.run(context.wait_until_quiescent_async(0.2))
+    assert time.monotonic() - start < 2
+    assert executor.time() > 0
+    context.terminate()
+    assert context.wait_until_quiescent(1)
+
+def main():
+  test_virtual_time_order()
+  test_run_until()
+  test_wait_until_quiescent_timeout()
+  print("Discrete event tests passed")
+
+if __name__ == "__main__":
+  main()
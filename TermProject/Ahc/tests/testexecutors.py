@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import io
+import threading
+import time
+
+from Ahc.Ahc import ComponentModel, Event, SimulationContext
+from Ahc.Executors import AsyncioExecutor, DiscreteEventExecutor, PoolExecutor, ThreadExecutor
+
+# Coroutine handlers run to completion on the executors without an event loop of their own
+
+class Sleeper(ComponentModel):
+  rounds = 200
+
+  def on_init(self, eventobj: Event):
+    self.count = 0
+    self.loops = set()
+    self.send_self(Event(self, "sleep", None))
+
+  async def on_sleep(self, eventobj: Event):
+    await asyncio.sleep(0)
+    self.loops.add(id(asyncio.get_running_loop()))
+    self.count += 1
+    if self.count < self.rounds:
+      self.send_self(Event(self, "sleep", None))
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.eventhandlers["sleep"] = self.on_sleep
+
+class Failer(ComponentModel):
+  batchsize = 8
+
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_work(self, eventobj: Event):
+    if eventobj.eventcontent % 3 == 0:
+      raise ValueError(f"failing on {eventobj.eventcontent}")
+    self.handled.append(eventobj.eventcontent)
+
+  async def on_awork(self, eventobj: Event):
+    await asyncio.sleep(0)
+    self.on_work(eventobj)
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.handled = []
+    self.eventhandlers["work"] = self.on_work
+    self.eventhandlers["awork"] = self.on_awork
+
+class Counter(ComponentModel):
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_count(self, eventobj: Event):
+    if self.busy:
+      self.overlaps += 1
+    self.busy = True
+    time.sleep(0.0001)
+    self.counted.append(eventobj.eventcontent)
+    self.threads.add(threading.get_ident())
+    self.busy = False
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.busy = False
+    self.overlaps = 0
+    self.counted = []
+    self.threads = set()
+    self.eventhandlers["count"] = self.on_count
+
+def test_pool_serves_queues():
+  executor = PoolExecutor(4)
+  with SimulationContext(executor) as context:
+    counters = [Counter("Counter", i) for i in range(20)]
+    for i in range(100):
+      for counter in counters:
+        counter.trigger_event(Event(None, "count", i))
+    assert context.wait_until_quiescent(20)
+    workers = {t.ident for t in executor.workers}
+    assert len(workers) == 4
+    for counter in counters:
+      assert counter.counted == list(range(100))
+      assert counter.overlaps == 0
+      assert counter.threads <= workers
+    assert len(set.union(*(counter.threads for counter in counters))) > 1
+    assert context.terminate(timeout=5)
+
+class Relay(ComponentModel):
+  active = 0
+  maxactive = 0
+
+  def on_init(self, eventobj: Event):
+    pass
+
+  async def on_token(self, eventobj: Event):
+    Relay.active += 1
+    Relay.maxactive = max(Relay.maxactive, Relay.active)
+    await asyncio.sleep(0.001)
+    Relay.active -= 1
+    self.threads.add(threading.get_ident())
+    hops = eventobj.eventcontent
+    self.handled += 1
+    if hops > 0:
+      self.next.trigger_event(Event(self, "token", hops - 1))
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.handled = 0
+    self.threads = set()
+    self.eventhandlers["token"] = self.on_token
+
+def test_asyncio_executor():
+  executor = AsyncioExecutor()
+  with SimulationContext(executor) as context:
+    relays = [Relay("Relay", i) for i in range(10)]
+    for relay, following in zip(relays, relays[1:] + relays[:1]):
+      relay.next = following
+    executor.start()
+    for relay in relays:
+      relay.trigger_event(Event(None, "token", 49))
+    assert context.wait_until_quiescent(20)
+    assert sum(relay.handled for relay in relays) == 500
+    assert set.union(*(relay.threads for relay in relays)) == {executor.thread.ident}
+    assert Relay.maxactive > 1
+    assert context.terminate(timeout=5)
+
+def test_failing_handlers():
+  for executor in (ThreadExecutor(), PoolExecutor(2), DiscreteEventExecutor()):
+    with SimulationContext(executor) as context, contextlib.redirect_stderr(io.StringIO()):
+      failer = Failer("Failer", 0)
+      for i in range(30):
+        failer.trigger_event(Event(None, "work" if i < 15 else "awork", i))
+      assert context.wait_until_quiescent(10)
+      assert failer.handled == [i for i in range(30) if i % 3], type(executor).__name__
+      assert failer.failedevents == 10, type(executor).__name__
+
+def test_coroutine_handlers():
+  for executor in (ThreadExecutor(), PoolExecutor(1), DiscreteEventExecutor()):
+    with SimulationContext(executor) as context:
+      sleeper = Sleeper("Sleeper", 0)
+      context.registry.init()
+      assert context.wait_until_quiescent(10)
+      assert sleeper.count == Sleeper.rounds, type(executor).__name__
+      assert len(sleeper.loops) == 1, type(executor).__name__
+
+def main():
+  test_pool_serves_queues()
+  test_coroutine_handlers()
+  test_asyncio_executor()
+  test_failing_handlers()
+  print("Executor tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,86 @@
+import random
+
+import networkx as nx
+
+from Ahc.Ahc import NOPATH, SimulationContext
+
+# The forwarding table routes every pair of nodes over a shortest path of the graph. Where several shortest paths
+# exist the next hop may differ from the one networkx picks, so the next hops are checked against the hop counts of
+# networkx
+
+def create_topology(G, lazy=False):
+  topo = SimulationContext().topology
+  topo.G = G
+  topo.compute_forwarding_table(lazy)
+  return topo
+
+def check_routes(topo):
+  G = topo.G
+  lengths = dict(nx.all_pairs_shortest_path_length(G))
+  for source in G.nodes:
+    row = topo.get_forwarding_row(source)
+    for destination in G.nodes:
+      nexthop = row[destination]
+      if destination not in lengths[source]:
+        assert nexthop == NOPATH, (source, destination, nexthop)
+      elif destination == source:
+        assert nexthop == source, (source, nexthop)
+      else:
+        assert G.has_edge(source, nexthop), (source, destination, nexthop)
+        assert lengths[nexthop][destination] == lengths[source][destination] - 1, (source, destination, nexthop)
+
+def graphs():
+  yield nx.path_graph(7)
+  yield nx.cycle_graph(12)
+  yield nx.grid_2d_graph(6, 6)
+  yield nx.disjoint_union(nx.cycle_graph(5), nx.path_graph(4))
+  yield nx.erdos_renyi_graph(80, 0.05, seed=3)
+  yield nx.gnp_random_graph(60, 0.06, seed=5, directed=True)
+  yield nx.random_geometric_graph(200, 0.12, seed=7)
+
+def test_table_against_networkx():
+  for G in graphs():
+    G = nx.convert_node_labels_to_integers(G)
+    check_routes(create_topology(G))
+    check_routes(create_topology(G, lazy=True))
+
+def test_distances_against_networkx():
+  for G in graphs():
+    G = nx.convert_node_labels_to_integers(G)
+    topo = create_topology(G)
+    assert topo.distances is None  # a static table holds no hop counts
+    distances = topo.distance_matrix()
+    assert distances.dtype == topo.ForwardingTable.dtype
+    lengths = dict(nx.all_pairs_shortest_path_length(G))
+    for source in G.nodes:
+      for destination in G.nodes:
+        assert distances[source, destination] == lengths[source].get(destination, NOPATH)
+
+# Random links are added and removed, the repaired rows must route like a table that is computed from scratch
+def test_repair_against_recompute():
+  rng = random.Random(11)
+  for G in (nx.erdos_renyi_graph(60, 0.04, seed=1), nx.gnp_random_graph(40, 0.05, seed=2, directed=True)):
+    for lazy in (False, True):
+      topo = create_topology(G.copy(), lazy)
+      for source in rng.sample(list(G.nodes), 10):
+        topo.get_forwarding_row(source)  # the lazy rows that are repaired
+      for i in range(60):
+        u, v = rng.sample(list(topo.G.nodes), 2)
+        if topo.G.has_edge(u, v):
+          topo.G.remove_edge(u, v)
+          topo.update_forwarding_table(u, v, inserted=False)
+        else:
+          topo.G.add_edge(u, v)
+          topo.update_forwarding_table(u, v, inserted=True)
+        check_routes(topo)
+      if not lazy:
+        assert (topo.distances == create_topology(topo.G).distance_matrix()).all()
+
+def main():
+  test_table_against_networkx()
+  test_distances_against_networkx()
+  test_repair_against_recompute()
+  print("Forwarding tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,96 @@
+import time
+
+from Ahc.Ahc import ComponentModel, ConnectorTypes, Event, EventTypes, GenericMessage, GenericMessageHeader, \
+  GenericMessagePayload, SimulationContext
+from Ahc.Channels import ChannelEventTypes, LinkModelChannel
+from Ahc.Executors import DiscreteEventExecutor, PoolExecutor, QueuePolicies, ThreadExecutor
+
+# A link delivers its messages after their serialization and propagation, in the order they were sent, and the
+# messages on a slow link hold the credits of the channel while they are transmitted
+
+class SlowLink(LinkModelChannel):
+  bandwidth = 1000
+  latency = 0.01
+  credits = 2
+  creditpolicy = QueuePolicies.DROPNEWEST
+
+class Endpoint(ComponentModel):
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_message_from_bottom(self, eventobj: Event):
+    self.received.append((self.executor.time(), eventobj.eventcontent.payload.messagepayload))
+
+  def send(self, payload):
+    header = GenericMessageHeader("DATA", self.componentinstancenumber, 1)
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, GenericMessagePayload(payload))))
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.received = []
+
+def connect(channeltype):
+  sender, receiver = Endpoint("Endpoint", 0), Endpoint("Endpoint", 1)
+  channel = channeltype(channeltype.__name__, "0-1")
+  sender.connect_me_to_channel(ConnectorTypes.DOWN, channel)
+  receiver.connect_me_to_channel(ConnectorTypes.DOWN, channel)
+  return sender, receiver, channel
+
+class TimedLink(LinkModelChannel):
+  bandwidth = 1000
+  latency = 0.01
+
+  # The messages that are held by the channel, like the LOCAL_MST messages of NodeChannel
+  def on_process_in_channel(self, eventobj: Event):
+    extradelay = 0.25 if eventobj.eventcontent.payload.messagepayload == b"held" else 0.0
+    self.transmit(Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent), extradelay)
+
+def test_transmission_times():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    sender, receiver, channel = connect(TimedLink)
+    context.registry.init()
+    executor.run()
+    for i in range(3):
+      sender.send(bytes(100))
+    executor.run()
+    # 64 bytes of header and 100 of payload take 0.164 s at 1000 B/s, the link is busy until the previous one is sent
+    assert [round(t, 6) for t, payload in receiver.received] == [0.174, 0.338, 0.502]
+    assert channel.transmittedbytes == 3 * 164
+
+def test_held_message_keeps_order():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    sender, receiver, channel = connect(TimedLink)
+    context.registry.init()
+    executor.run()
+    sender.send(b"held")
+    sender.send(bytes(100))
+    executor.run()
+    assert [payload for t, payload in receiver.received] == [b"held", bytes(100)]
+    assert [round(t, 6) for t, payload in receiver.received] == [0.25 + 0.068 + 0.01, 0.25 + 0.068 + 0.164 + 0.01]
+
+def test_credits_of_delayed_messages():
+  for executor in (ThreadExecutor(), PoolExecutor(2), DiscreteEventExecutor()):
+    with SimulationContext(executor) as context:
+      sender, receiver, channel = connect(SlowLink)
+      context.registry.init()
+      context.wait_until_quiescent(5)
+      for i in range(20):
+        sender.send(bytes(100))
+        assert channel.backlog() <= SlowLink.credits, type(executor).__name__
+        time.sleep(0.001)
+      assert context.wait_until_quiescent(10)
+      assert channel.droppedmessages >= 15, (type(executor).__name__, channel.droppedmessages)
+      assert len(receiver.received) == 20 - channel.droppedmessages
+      assert channel.backlog() == 0
+      context.terminate(timeout=5)
+
+def main():
+  test_transmission_times()
+  test_held_message_keeps_order()
+  test_credits_of_delayed_messages()
+  print("Link tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,63 @@
+import numpy as np
+
+from Ahc.Ahc import SimulationContext
+from Ahc.Channels import P2PFIFOFairLossChannel, P2PFIFOGilbertElliottChannel, RandomBlocks
+from Ahc.Executors import DiscreteEventExecutor
+
+# The lossy channels draw from blocks of random numbers, the draws follow the stream of the generator of the channel
+# whatever the sizes of the draws and the blocks, so the losses are reproducible with the seed of the context
+
+def create_channel(channeltype, seed, **attributes):
+  with SimulationContext(DiscreteEventExecutor(), seed):
+    channel = channeltype(channeltype.__name__, "0-1")
+  for name, value in attributes.items():
+    setattr(channel, name, value)
+  return channel
+
+def test_blocks_follow_the_stream():
+  randomblocks = RandomBlocks(np.random.default_rng(5))
+  randomblocks.blocksize = 10
+  counts = [3, 7, 5, 12, 1, 30, 2]
+  drawn = [value for count in counts for value in randomblocks.uniforms(count)]
+  assert drawn == np.random.default_rng(5).random(len(drawn)).tolist()
+  assert [len(randomblocks.uniforms(count)) for count in counts] == counts
+
+def test_fair_loss_rates():
+  count = 100000
+  channel = create_channel(P2PFIFOFairLossChannel, 1, prob=0.7)
+  copies = np.array(channel.delivered_copies(count))
+  assert set(copies.tolist()) == {0, 1}
+  assert abs(copies.mean() - 0.7) < 0.01
+  channel = create_channel(P2PFIFOFairLossChannel, 1, prob=0.9, duplicationprobability=0.5)
+  copies = np.array(channel.delivered_copies(count))
+  assert copies.max() > 2
+  assert abs(copies.mean() - 0.9 / (1 - 0.5)) < 0.03
+
+def test_reproducible_with_seed():
+  draws = {}
+  for seed in (1, 1, 2):
+    channel = create_channel(P2PFIFOFairLossChannel, seed, prob=0.5, duplicationprobability=0.2)
+    draws.setdefault(seed, []).append([channel.delivered_copies(count) for count in (1, 50, 7, 5000)])
+  assert draws[1][0] == draws[1][1]
+  assert draws[1][0] != draws[2][0]
+
+# The bad state holds for 1 / badtogood messages on average and is entered goodtobad / (goodtobad + badtogood) of the
+# time
+def test_burst_losses():
+  channel = create_channel(P2PFIFOGilbertElliottChannel, 3)
+  channel.setBurstLoss(0.01, 0.25)
+  copies = np.concatenate([channel.delivered_copies(count) for count in (1, 999, 4000, 195000)])
+  lost = copies == 0
+  assert abs(lost.mean() - 0.01 / (0.01 + 0.25)) < 0.01
+  bursts = np.diff(np.flatnonzero(np.diff(np.concatenate(([0], lost.astype(np.int8), [0])))))[::2]
+  assert abs(bursts.mean() - 1 / 0.25) < 0.5
+
+def main():
+  test_blocks_follow_the_stream()
+  test_fair_loss_rates()
+  test_reproducible_with_seed()
+  test_burst_losses()
+  print("Loss tests passed")
+
+if __name__ == "__main__":
+  main()
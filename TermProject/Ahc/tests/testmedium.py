@@ -0,0 +1,69 @@
+import networkx as nx
+
+from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, SimulationContext
+from Ahc.Channels import FIFOBroadcastPerfectChannel
+from Ahc.Executors import DiscreteEventExecutor
+
+# Every member of a broadcast medium hears the messages of all the others but not its own, the messages of different
+# senders within the collision window are lost
+
+class Station(ComponentModel):
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_send(self, eventobj: Event):
+    header = GenericMessageHeader("DATA", self.componentinstancenumber, -1)
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, eventobj.eventcontent)))
+
+  def on_message_from_bottom(self, eventobj: Event):
+    self.received.append((round(self.executor.time(), 6), eventobj.eventcontent.payload))
+
+  def send_at(self, time, payload):
+    self.inputqueue.put_later(Event(self, "send", payload), time)
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.received = []
+    self.eventhandlers["send"] = self.on_send
+
+def create(executor, context, collisionwindow):
+  medium = type("Medium", (FIFOBroadcastPerfectChannel,), {"collisionwindow": collisionwindow})
+  context.topology.construct_broadcast_medium(nx.path_graph(5), Station, medium)
+  context.topology.start()
+  executor.run()
+  return context.topology
+
+def test_delivery_to_all_but_sender():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = create(executor, context, 0.0)
+    assert topo.get_neighbors(0) == [1, 2, 3, 4]
+    assert topo.get_next_hop(0, 4) == 4
+    topo.nodes[0].send_at(1.0, "first")
+    topo.nodes[3].send_at(2.0, "second")
+    executor.run()
+    for i, node in topo.nodes.items():
+      expected = [(1.0, "first")] if i != 0 else []
+      expected += [(2.0, "second")] if i != 3 else []
+      assert node.received == expected, (i, node.received)
+
+def test_collision_window():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = create(executor, context, 0.01)
+    topo.nodes[1].send_at(1.0, "collides")
+    topo.nodes[2].send_at(1.005, "collides too")
+    topo.nodes[3].send_at(1.05, "alone")
+    topo.nodes[3].send_at(1.055, "same sender")
+    executor.run()
+    assert topo.channels["medium"].collisions == 2
+    assert topo.nodes[0].received == [(1.06, "alone"), (1.065, "same sender")]
+    assert topo.nodes[3].received == []
+
+def main():
+  test_delivery_to_all_but_sender()
+  test_collision_window()
+  print("Medium tests passed")
+
+if __name__ == "__main__":
+  main()
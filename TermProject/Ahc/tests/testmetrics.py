@@ -0,0 +1,42 @@
+import time
+
+from Ahc.Ahc import ComponentModel, Event, SimulationContext
+from Ahc.Executors import DiscreteEventExecutor
+
+# An event that a component sends to itself again waits only from its last put, not from its creation
+
+class Repeater(ComponentModel):
+  rounds = 20
+
+  def on_init(self, eventobj: Event):
+    self.count = 0
+    self.send_self(Event(self, "repeat", None))
+
+  def on_repeat(self, eventobj: Event):
+    time.sleep(0.002)
+    self.count += 1
+    if self.count < self.rounds:
+      self.send_self(eventobj)
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.eventhandlers["repeat"] = self.on_repeat
+
+def test_wait_of_resent_event():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    context.registry.enable_metrics()
+    repeater = Repeater("Repeater", 0)
+    context.registry.init()
+    executor.run()
+    waiting = context.registry.get_metrics()["Repeater0"]["waiting"]["repeat"]
+    assert repeater.count == Repeater.rounds
+    assert waiting["count"] == Repeater.rounds
+    assert waiting["maxus"] < 2000, waiting
+
+def main():
+  test_wait_of_resent_event()
+  print("Metrics tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from Ahc.Ahc import ComponentModel, Event, EventPriorities, SimulationContext
+from Ahc.Executors import AsyncioEventQueue, AsyncioExecutor, DiscreteEventExecutor, EventQueue, QueuePolicies, \
+  ThreadExecutor
+
+# The queues are created without components, nothing takes their events while the test looks at them
+
+class QueueOwner:
+  agingwindow = 4
+  num_worker_threads = 1
+
+def create_queue(executor, capacity, policy, prioritized=False):
+  if isinstance(executor, DiscreteEventExecutor):
+    myqueue = executor.create_queue(QueueOwner(), prioritized)
+  elif isinstance(executor, AsyncioExecutor):
+    myqueue = AsyncioEventQueue(executor, QueueOwner(), prioritized)
+  else:
+    myqueue = EventQueue(executor, QueueOwner(), prioritized)
+  myqueue.capacity = capacity
+  myqueue.policy = policy
+  return myqueue
+
+def pending(executor, myqueue):
+  if isinstance(executor, DiscreteEventExecutor):
+    return [item.eventcontent for delay, item in executor.pending_events([myqueue])[myqueue]]
+  return [item.eventcontent for delay, item in myqueue.pending_items()]
+
+def put(myqueue, content, priority=EventPriorities.NORMAL):
+  myqueue.put_nowait(Event(None, "test", content, priority=priority))
+
+def test_dropoldest_keeps_priorities():
+  for executor in (ThreadExecutor(), AsyncioExecutor(), DiscreteEventExecutor()):
+    myqueue = create_queue(executor, 2, QueuePolicies.DROPOLDEST, prioritized=True)
+    put(myqueue, "old-normal")
+    put(myqueue, "high", EventPriorities.HIGH)
+    put(myqueue, "new-normal")
+    assert sorted(pending(executor, myqueue)) == ["high", "new-normal"], type(executor).__name__
+    assert myqueue.dropped == 1
+
+# With an aging window of 4 an event overtakes the events of one priority level lower that were put fewer than 4
+# puts before it, and the ones of two levels lower that were put fewer than 8 puts before it
+def test_priority_aging():
+  for executor in (ThreadExecutor(), AsyncioExecutor(), DiscreteEventExecutor()):
+    myqueue = create_queue(executor, 0, QueuePolicies.BLOCK, prioritized=True)
+    put(myqueue, "low", EventPriorities.LOW)
+    put(myqueue, "normal", EventPriorities.NORMAL)
+    for i in range(12):
+      put(myqueue, i, EventPriorities.HIGH)
+    assert pending(executor, myqueue) == [0, 1, 2, "normal", 3, 4, 5, "low", 6, 7, 8, 9, 10, 11], \
+      type(executor).__name__
+
+def test_unprioritized_queue_is_fifo():
+  for executor in (ThreadExecutor(), AsyncioExecutor(), DiscreteEventExecutor()):
+    myqueue = create_queue(executor, 0, QueuePolicies.BLOCK)
+    for i, priority in enumerate((EventPriorities.LOW, EventPriorities.HIGH, EventPriorities.NORMAL)):
+      put(myqueue, i, priority)
+    assert pending(executor, myqueue) == [0, 1, 2], type(executor).__name__
+
+# The executors that cannot block the sender take the events over the capacity and count them
+def test_policies_of_full_queues():
+  expected = {QueuePolicies.DROPNEWEST: ([0, 1, 2], 3, 0), QueuePolicies.DROPOLDEST: ([3, 4, 5], 3, 0),
+              QueuePolicies.BLOCK: ([0, 1, 2, 3, 4, 5], 0, 3)}
+  for policy, (remaining, dropped, overflowed) in expected.items():
+    executors = (AsyncioExecutor(), DiscreteEventExecutor())
+    if policy != QueuePolicies.BLOCK:
+      executors += (ThreadExecutor(),)
+    for executor in executors:
+      myqueue = create_queue(executor, 3, policy)
+      for i in range(6):
+        put(myqueue, i)
+      assert pending(executor, myqueue) == remaining, (policy, type(executor).__name__)
+      assert (myqueue.dropped, myqueue.overflowed) == (dropped, overflowed), (policy, type(executor).__name__)
+      assert myqueue.highwater == len(remaining)
+      if not isinstance(executor, DiscreteEventExecutor):
+        assert executor.outstanding == len(remaining), (policy, type(executor).__name__)
+
+class Consumer(ComponentModel):
+  queuecapacity = 4
+  queuepolicy = QueuePolicies.BLOCK
+
+  def on_init(self, eventobj: Event):
+    pass
+
+  def on_consume(self, eventobj: Event):
+    time.sleep(0.001)
+    self.consumed.append(eventobj.eventcontent)
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.consumed = []
+    self.eventhandlers["consume"] = self.on_consume
+
+def produce(consumer, first):
+  for i in range(first, first + 50):
+    consumer.trigger_event(Event(None, "consume", i))
+
+def test_block_waits_for_room():
+  executor = ThreadExecutor()
+  with SimulationContext(executor) as context:
+    consumer = Consumer("Consumer", 0)
+    producers = [threading.Thread(target=produce, args=[consumer, first]) for first in (0, 100)]
+    for producer in producers:
+      producer.start()
+    for producer in producers:
+      producer.join()
+    assert context.wait_until_quiescent(10)
+    assert [i for i in consumer.consumed if i < 100] == list(range(50))
+    assert [i for i in consumer.consumed if i >= 100] == list(range(100, 150))
+    assert consumer.inputqueue.highwater <= 4
+    assert (consumer.inputqueue.dropped, consumer.inputqueue.overflowed) == (0, 0)
+    assert context.terminate(timeout=5)
+
+def main():
+  test_dropoldest_keeps_priorities()
+  test_priority_aging()
+  test_unprioritized_queue_is_fifo()
+  test_policies_of_full_queues()
+  test_block_waits_for_room()
+  print("Queue tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,74 @@
+import asyncio
+
+import networkx as nx
+
+from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, SimulationContext
+from Ahc.Channels import Channel
+from Ahc.Executors import AsyncioExecutor, DiscreteEventExecutor, PoolExecutor, ThreadExecutor
+from Ahc.Replay import EventLog, ReplayExecutor
+
+# A recorded run is replayed exactly, also when the handlers of a component interleave on the asyncio executor
+
+class Gossip(ComponentModel):
+  def on_init(self, eventobj: Event):
+    self.draws = []
+    if self.componentinstancenumber == 0:
+      self.send_down(Event(self, EventTypes.MFRT, GenericMessage(GenericMessageHeader("GOSSIP", 0, -1), 4)))
+
+  async def on_message_from_bottom(self, eventobj: Event):
+    ttl = eventobj.eventcontent.payload
+    first = self.random.random()
+    await asyncio.sleep(0)
+    self.draws.append((first, self.random.random()))
+    if ttl > 0 and self.random.random() < 0.6:
+      header = GenericMessageHeader("GOSSIP", self.componentinstancenumber, -1)
+      self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, ttl - 1)))
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber, num_worker_threads=2)
+
+class GossipChannel(Channel):
+  def __init__(self, componentname, componentinstancenumber, weight=1):
+    super().__init__(componentname, componentinstancenumber)
+
+def build(context, seed):
+  G = nx.random_geometric_graph(20, 0.4, seed=seed)
+  nx.set_edge_attributes(G, 1, 'weight')
+  context.topology.construct_from_graph(G, Gossip, GossipChannel)
+  context.topology.start()
+  return context.topology
+
+def record(executor, seed):
+  eventlog = EventLog(seed)
+  with SimulationContext(executor, seed) as context:
+    eventlog.attach(context)
+    topo = build(context, seed)
+    if isinstance(executor, AsyncioExecutor):
+      executor.run(context.wait_until_quiescent_async(20))
+      executor.loopthread = None
+    else:
+      assert context.wait_until_quiescent(20)
+    draws = {key: node.draws for key, node in topo.nodes.items()}
+    context.terminate(timeout=5)
+  return eventlog, draws
+
+def replay(eventlog):
+  executor = ReplayExecutor(eventlog)
+  with SimulationContext(executor, eventlog.seed) as context:
+    topo = build(context, eventlog.seed)
+    context.wait_until_quiescent()
+    assert executor.finished()
+    return {key: node.draws for key, node in topo.nodes.items()}
+
+def test_exact_replay():
+  for executor in (AsyncioExecutor(), ThreadExecutor(), PoolExecutor(3), DiscreteEventExecutor()):
+    eventlog, draws = record(executor, 11)
+    assert sum(map(len, draws.values())) > 20
+    assert replay(eventlog) == draws, type(executor).__name__
+
+def main():
+  test_exact_replay()
+  print("Replay tests passed")
+
+if __name__ == "__main__":
+  main()
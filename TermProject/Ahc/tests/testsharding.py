@@ -0,0 +1,75 @@
+import multiprocessing
+
+import networkx as nx
+
+from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, SimulationContext
+from Ahc.Channels import P2PFIFOPerfectChannel
+from Ahc.Executors import ThreadExecutor
+from Ahc.Sharding import partition_graph
+
+# A message crosses the cut between two shard processes and is answered, the shards are quiescent afterwards and stop
+# with the simulation. The nodes report to the test through a queue that the forked shards inherit
+
+class WeightedChannel(P2PFIFOPerfectChannel):
+  def __init__(self, componentname, componentinstancenumber, weight=1):
+    super().__init__(componentname, componentinstancenumber)
+
+class Pinger(ComponentModel):
+  results = None
+
+  def on_init(self, eventobj: Event):
+    pass
+
+  def send_to(self, peer, payload):
+    interfaceid = f"{min(self.componentinstancenumber, peer)}-{max(self.componentinstancenumber, peer)}"
+    header = GenericMessageHeader("DATA", self.componentinstancenumber, peer, peer, interfaceid)
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, payload)))
+
+  def ping(self, peer):
+    self.send_to(peer, "ping")
+
+  def on_message_from_bottom(self, eventobj: Event):
+    header = eventobj.eventcontent.header
+    if header.messageto != self.componentinstancenumber:
+      return
+    if eventobj.eventcontent.payload == "ping":
+      self.send_to(header.messagefrom, "pong")
+    else:
+      Pinger.results.put((self.componentinstancenumber, header.messagefrom))
+
+def weighted(G):
+  nx.set_edge_attributes(G, 1, 'weight')
+  return G
+
+def test_ping_across_the_cut():
+  Pinger.results = multiprocessing.get_context().Queue()
+  with SimulationContext(ThreadExecutor(), seed=3) as context:
+    topo = context.topology
+    topo.construct_from_graph(weighted(nx.path_graph(6)), Pinger, WeightedChannel, numshards=2)
+    shards = topo.shards
+    assert shards.get_cut_size() == 1
+    u, v = next((u, v) for u, v in topo.G.edges if shards.assignment[u] != shards.assignment[v])
+    topo.start()
+    shards.call_node(u, "ping", v)
+    assert Pinger.results.get(timeout=20) == (u, v)
+    assert context.wait_until_quiescent(20)
+    assert context.terminate(timeout=10)
+    assert not any(p.is_alive() for p in shards.processes)
+
+def test_seeded_partition():
+  G = weighted(nx.random_geometric_graph(60, 0.2, seed=1))
+  assert partition_graph(G, 4, seed=7) == partition_graph(G, 4, seed=7)
+  assignments = []
+  for i in range(2):
+    with SimulationContext(ThreadExecutor(), seed=7) as context:
+      context.topology.construct_from_graph(G, Pinger, WeightedChannel, numshards=4)
+      assignments.append(context.topology.shards.assignment)
+  assert assignments[0] == assignments[1] == partition_graph(G, 4, seed=7)
+
+def main():
+  test_ping_across_the_cut()
+  test_seeded_partition()
+  print("Sharding tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,58 @@
+import time
+
+from Ahc.Ahc import ComponentModel, Event, SimulationContext
+from Ahc.Executors import PoolExecutor, ThreadExecutor, TimerWheel
+
+# The timers of the wheel expire in the order of their expiry, also after they are moved down from the higher levels or
+# the overflow, and the timers that are dropped by a stop are done for the executor
+
+class Sleeper(ComponentModel):
+  def on_init(self, eventobj: Event):
+    self.inputqueue.put_later(Event(self, "wakeup", None), 60)
+
+  def on_wakeup(self, eventobj: Event):
+    pass
+
+  def __init__(self, componentname, componentinstancenumber):
+    super().__init__(componentname, componentinstancenumber)
+    self.eventhandlers["wakeup"] = self.on_wakeup
+
+def schedule(executor, timerwheel, delay, fired):
+  def expire():
+    fired.append((delay, time.monotonic() - start))
+    executor.event_done()
+  start = time.monotonic()
+  executor.event_scheduled()
+  timerwheel.schedule(delay, expire)
+
+def test_cascade_and_overflow():
+  executor = ThreadExecutor()
+  # the levels span 4 and 16 ticks of 2 ms, the timers after 32 ms wait in overflow
+  timerwheel = TimerWheel(executor, resolution=0.002, slots=4, levels=2)
+  fired = []
+  delays = [0.09, 0.003, 0.05, 0.011, 0.02, 0.035, 0.007, 0.15]
+  for delay in delays:
+    schedule(executor, timerwheel, delay, fired)
+  assert executor.wait_until_quiescent(5)
+  timerwheel.stop()
+  assert [delay for delay, elapsed in fired] == sorted(delays)
+  for delay, elapsed in fired:
+    assert elapsed >= delay, (delay, elapsed)
+
+def test_stop_drops_pending_timers():
+  for executor in (ThreadExecutor(), PoolExecutor(2)):
+    with SimulationContext(executor) as context:
+      sleepers = [Sleeper("Sleeper", i) for i in range(3)]
+      context.registry.init()
+      time.sleep(0.1)
+      assert not context.wait_until_quiescent(0.1)
+      assert context.terminate(timeout=5), type(executor).__name__
+      assert context.wait_until_quiescent(5), type(executor).__name__
+
+def main():
+  test_cascade_and_overflow()
+  test_stop_drops_pending_timers()
+  print("Timer tests passed")
+
+if __name__ == "__main__":
+  main()
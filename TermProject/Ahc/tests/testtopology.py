@@ -0,0 +1,102 @@
+from math import inf
+
+import networkx as nx
+
+from Ahc.Ahc import ComponentModel, ConnectorTypes, Event, EventTypes, GenericMessage, GenericMessageHeader, \
+  SimulationContext, TopologyError
+from Ahc.Channels import P2PFIFOPerfectChannel
+from Ahc.Executors import DiscreteEventExecutor
+
+# Links that are added or removed after the topology is started are used by the nodes right away
+
+class WeightedChannel(P2PFIFOPerfectChannel):
+  def __init__(self, componentname, componentinstancenumber, weight=1):
+    super().__init__(componentname, componentinstancenumber)
+    self.weight = weight
+
+class RoutingNode(ComponentModel):
+  def on_init(self, eventobj: Event):
+    self.received = []
+
+  def on_message_from_bottom(self, eventobj: Event):
+    self.received.append(eventobj.eventcontent.payload)
+
+  def send_to(self, destination, nexthop, payload):
+    interfaceid = f"{min(self.componentinstancenumber, nexthop)}-{max(self.componentinstancenumber, nexthop)}"
+    header = GenericMessageHeader("DATA", self.componentinstancenumber, destination, nexthop, interfaceid)
+    self.send_down(Event(self, EventTypes.MFRT, GenericMessage(header, payload)))
+
+def weighted(G):
+  nx.set_edge_attributes(G, 1, 'weight')
+  return G
+
+def test_add_edge_after_start():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = context.topology
+    topo.construct_from_graph(weighted(nx.path_graph(3)), RoutingNode, WeightedChannel)
+    topo.start()
+    executor.run()
+
+    topo.add_edge(0, 2, WeightedChannel)
+    assert len(topo.nodes[0].downroutes) == len(topo.nodes[0].connectors[ConnectorTypes.DOWN]) == 2
+    assert topo.get_next_hop(0, 2) == 2
+    topo.nodes[0].send_to(2, topo.get_next_hop(0, 2), "over the new link")
+    executor.run()
+    assert topo.nodes[2].received == ["over the new link"]
+
+def test_remove_edge_after_start():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = context.topology
+    topo.construct_from_graph(weighted(nx.cycle_graph(4)), RoutingNode, WeightedChannel)
+    topo.start()
+    executor.run()
+
+    topo.remove_edge(0, 1)
+    assert len(topo.nodes[0].downroutes) == 1
+    assert topo.get_next_hop(0, 1) == 3
+    topo.nodes[0].send_to(1, topo.get_next_hop(0, 1), "around the cycle")
+    executor.run()
+    assert topo.nodes[3].received == ["around the cycle"]
+    assert topo.nodes[1].received == []
+
+def test_duplicate_and_missing_links():
+  executor = DiscreteEventExecutor()
+  with SimulationContext(executor) as context:
+    topo = context.topology
+    topo.construct_from_graph(weighted(nx.path_graph(3)), RoutingNode, WeightedChannel)
+    topo.start()
+    executor.run()
+
+    components = len(context.registry.components)
+    for u, v in [(0, 1), (1, 0)]:
+      try:
+        topo.add_edge(u, v, WeightedChannel)
+        assert False, (u, v)
+      except TopologyError:
+        pass
+    assert len(context.registry.components) == components
+    assert len(topo.nodes[1].downroutes) == 2
+
+    try:
+      topo.remove_edge(0, 2)
+      assert False
+    except TopologyError:
+      pass
+    topo.remove_edge(1, 0)
+    try:
+      topo.remove_edge(0, 1)
+      assert False
+    except TopologyError:
+      pass
+    assert topo.get_next_hop(0, 2) == inf
+
+def main():
+  test_add_edge_after_start()
+  test_remove_edge_after_start()
+  test_duplicate_and_missing_links()
+  print("Topology tests passed")
+
+if __name__ == "__main__":
+  main()
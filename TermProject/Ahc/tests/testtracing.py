@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+from Ahc.Ahc import SimulationContext
+from Ahc.Executors import DiscreteEventExecutor
+from Ahc.Tracing import Trace, Tracer
+from Ahc.tests.testmetrics import Repeater
+
+# Every put of an event that is sent again is a record of its own, its wait is measured from that put
+
+def test_wait_of_resent_event():
+  executor = DiscreteEventExecutor()
+  with tempfile.TemporaryDirectory() as directory, SimulationContext(executor) as context:
+    path = os.path.join(directory, "trace.bin")
+    tracer = Tracer(capacity=1024)
+    tracer.attach(context)
+    Repeater("Repeater", 0)
+    context.registry.init()
+    executor.run()
+    tracer.save(path)
+    trace = Trace(path)
+    repeats = trace.handles[trace.handles['event'] == trace.names["events"].index("repeat")]
+    assert len(repeats) == Repeater.rounds
+    assert len(set(repeats['eventtime'])) == Repeater.rounds
+    waits = repeats['time'] - repeats['eventtime']
+    assert waits.max() < 2000000, waits
+
+def main():
+  test_wait_of_resent_event()
+  print("Tracing tests passed")
+
+if __name__ == "__main__":
+  main()
@@ -1,6 +1,8 @@
 from Ahc.Ahc import ComponentModel, Event
 
 class LinkComponent(ComponentModel):
+    passthrough = True
+
     def on_init(self, eventobj: Event):
         pass
 
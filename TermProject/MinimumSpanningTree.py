@@ -2,7 +2,8 @@ from copy import deepcopy as deepcopy
 from enum import Enum
 import networkx as nx
 
-from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, GenericMessagePayload
+from Ahc.Ahc import ComponentModel, Event, EventTypes, EventPriorities, GenericMessage, GenericMessageHeader, \
+    GenericMessagePayload
 from Ahc.Channels import MessageDestinationIdentifiers
 from Utility import drawGraph, getPathInMST, getMaximumWeightedEdge, selectDeactivatedNode, optimizeInsertions, \
     optimizeDeletions
@@ -22,6 +23,16 @@ class LMSTUpdate:
             self.activatedNodes = []
         self.isCompressed = isCompressed
 
+    # The size of the update as it would be sent, 8 bytes per node id and weight: a compressed update sends its
+    # inserted edges with their weights, its deleted edges and its activated nodes, an uncompressed one the whole tree
+    @property
+    def nbytes(self):
+        if self.isCompressed:
+            return 1 + 24 * len(self.insertions) + 16 * len(self.deletions) + 8 * len(self.activatedNodes)
+        if self.localMST is None:
+            return 1
+        return 1 + 9 * self.localMST.number_of_nodes() + 24 * self.localMST.number_of_edges()
+
 
 class MSTEventTypes(Enum):
     MFRNeighbor = "messagefromneighbor"
@@ -34,17 +45,23 @@ class MSTMessageTypes(Enum):
 
 
 class NEIGHBORMessagePayload(GenericMessagePayload):
+    __slots__ = ()
+
     def __init__(self, weight=1):
         super().__init__(weight)
 
 
 class NEIGHBORMessageHeader(GenericMessageHeader):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto):
         super().__init__(MSTMessageTypes.NEIGHBOR_DISCOVERY, messagefrom, messageto,
-                         nexthop=MessageDestinationIdentifiers.LINKLAYERBROADCAST)
+                         nexthop=MessageDestinationIdentifiers.LINKLAYERBROADCAST, priority=EventPriorities.HIGH)
 
 
 class LOCALMSTMessagePayload(GenericMessagePayload):
+    __slots__ = ('manualMode', 'nextActivationNode')
+
     def __init__(self, lmstUpdate: LMSTUpdate, manualMode=False, nextActivationNode=-1):
         super().__init__(lmstUpdate)
         self.manualMode = manualMode
@@ -52,15 +69,20 @@ class LOCALMSTMessagePayload(GenericMessagePayload):
 
 
 class LOCALMSTMessageHeader(GenericMessageHeader):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto):
         if messageto == -1:
             super().__init__(MSTMessageTypes.LOCAL_MST, messagefrom, messageto,
-                             nexthop=MessageDestinationIdentifiers.LINKLAYERBROADCAST)
+                             nexthop=MessageDestinationIdentifiers.LINKLAYERBROADCAST, priority=EventPriorities.HIGH)
         else:
-            super().__init__(MSTMessageTypes.LOCAL_MST, messagefrom, messageto, nexthop=messageto)
+            super().__init__(MSTMessageTypes.LOCAL_MST, messagefrom, messageto, nexthop=messageto,
+                             priority=EventPriorities.HIGH)
 
 
 class MSTMessage(GenericMessage):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto, messagetype: MSTMessageTypes,
                  messagepayload=None, manualMode=False, nextActivationNode=-1):
         if messagetype == MSTMessageTypes.NEIGHBOR_DISCOVERY:
@@ -72,6 +94,8 @@ class MSTMessage(GenericMessage):
 
 
 class MSTComponent(ComponentModel):
+    prioritized = True  # MST messages skip ahead of the RPS weights that pass through
+
     def on_init(self, eventobj: Event):
         mstMessage = MSTMessage(self.componentinstancenumber, -1, MSTMessageTypes.NEIGHBOR_DISCOVERY)
         mstEvent = Event(self, EventTypes.MFRT, mstMessage)
@@ -6,6 +6,8 @@ from ReliableParameterServer import RPSComponent
 
 
 class Node(ComponentModel):
+    passthrough = True
+
     def on_init(self, eventobj: Event):
         pass
 
@@ -1,25 +1,29 @@
 import copy
-import time
 
 from Ahc.Ahc import Event, EventTypes
-from Ahc.Channels import Channel, ChannelEventTypes, MessageDestinationIdentifiers
+from Ahc.Channels import ChannelEventTypes, LinkModelChannel, MessageDestinationIdentifiers
 from MinimumSpanningTree import MSTMessage, MSTMessageTypes
 
 totalWeight = 0
 
-class NodeChannel(Channel):
+class NodeChannel(LinkModelChannel):
+    prioritized = True
 
     def on_message_from_top(self, eventobj: Event):
         header = eventobj.eventcontent.header
         if header.nexthop == MessageDestinationIdentifiers.LINKLAYERBROADCAST:
             myevent = Event(eventobj.eventsource, ChannelEventTypes.INCH, eventobj.eventcontent)
-            self.channelqueue.put_nowait(myevent)
+            self.put_in_channel(myevent)
         elif header.nexthop in self.connectedNodeIds:
             myevent = Event(eventobj.eventsource, ChannelEventTypes.INCH, eventobj.eventcontent)
-            self.channelqueue.put_nowait(myevent)
+            self.put_in_channel(myevent)
         elif header.messageto != header.messagefrom and header.messageto in self.connectedNodeIds:
             myevent = Event(eventobj.eventsource, ChannelEventTypes.INCH, eventobj.eventcontent)
-            self.channelqueue.put_nowait(myevent)
+            self.put_in_channel(myevent)
+
+    # The MST messages are delayed or changed by the channel, they are not coalesced
+    def coalesces(self, eventobj: Event):
+        return not isinstance(eventobj.eventcontent, MSTMessage)
 
     def on_process_in_channel(self, eventobj: Event):
         if isinstance(eventobj.eventcontent, MSTMessage) \
@@ -27,13 +31,14 @@ class NodeChannel(Channel):
             myeventcontent = copy.deepcopy(eventobj.eventcontent)
             myeventcontent.payload.messagepayload = self.weight
             myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, myeventcontent)
-            self.outputqueue.put_nowait(myevent)
+            self.transmit(myevent)
         else:
+            myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent)
             if isinstance(eventobj.eventcontent, MSTMessage) \
                     and eventobj.eventcontent.header.messagetype == MSTMessageTypes.LOCAL_MST:
-                time.sleep(0.25)
-            myevent = Event(eventobj.eventsource, ChannelEventTypes.DLVR, eventobj.eventcontent)
-            self.outputqueue.put_nowait(myevent)
+                self.transmit(myevent, 0.25)
+            else:
+                self.transmit(myevent)
 
     def on_deliver_to_component(self, eventobj: Event):
         sourceNodeId = eventobj.eventsource.componentinstancenumber
@@ -7,7 +7,8 @@ from numpy import loadtxt
 from keras.models import Sequential
 from keras.layers import Dense
 
-from Ahc.Ahc import ComponentModel, Event, EventTypes, GenericMessage, GenericMessageHeader, GenericMessagePayload
+from Ahc.Ahc import ComponentModel, Event, EventTypes, EventPriorities, GenericMessage, GenericMessageHeader, \
+    GenericMessagePayload
 from MinimumSpanningTree import MSTMessageTypes, LMSTUpdate
 
 
@@ -19,6 +20,7 @@ OUTPUT_FILE_PATH = "Output/without_aggregated_accuracies.txt"
 EPOCH = 5
 LAST_TRAINING_ROUND = 40
 WEIGHT_AVERAGING = True
+SHARE_BATCH_SIZE = 64
 
 class RPSEventTypes(Enum):
     MST_CONSTRUCTED = "minimumspanningtreeconstructed"
@@ -32,31 +34,47 @@ class RPSMessageTypes(Enum):
     SHARE = "share"
 
 class RPSStartMessagePayload(GenericMessagePayload):
+    __slots__ = ()
+
     def __init__(self, mst: nx.Graph):
         super().__init__(mst)
 
 class RPSStartMessageHeader(GenericMessageHeader):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto):
-        super().__init__(RPSMessageTypes.START, messagefrom, messageto, nexthop=messageto)
+        super().__init__(RPSMessageTypes.START, messagefrom, messageto, nexthop=messageto,
+                         priority=EventPriorities.HIGH)
 
 class RPSTrainMessagePayload(GenericMessagePayload):
+    __slots__ = ()
+
     def __init__(self, messagepayload=None):
         super().__init__(messagepayload)
 
 class RPSTrainMessageHeader(GenericMessageHeader):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto):
         super().__init__(RPSMessageTypes.TRAIN, messagefrom, messageto, nexthop=messageto)
 
 class RPSShareMessagePayload(GenericMessagePayload):
+    __slots__ = ('source',)
+
     def __init__(self, weights, source):
         super().__init__(weights)
         self.source = source
 
 class RPSShareMessageHeader(GenericMessageHeader):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto):
-        super().__init__(RPSMessageTypes.SHARE, messagefrom, messageto, nexthop=messageto)
+        super().__init__(RPSMessageTypes.SHARE, messagefrom, messageto, nexthop=messageto,
+                         priority=EventPriorities.LOW)
 
 class RPSMessage(GenericMessage):
+    __slots__ = ()
+
     def __init__(self, messagefrom, messageto, messagetype: RPSMessageTypes, messagepayload=None, source=-1):
         if messagetype == RPSMessageTypes.START:
             super().__init__(header=RPSStartMessageHeader(messagefrom, messageto),
@@ -69,6 +87,7 @@ class RPSMessage(GenericMessage):
                              payload=RPSShareMessagePayload(messagepayload, source))
 
 class RPSComponent(ComponentModel):
+    prioritized = True
     dataset = loadtxt(DATASET_PATH, delimiter=',')
     trainingFeatures = dataset[:, 1:]
     trainingLabels = dataset[:, 0]
@@ -97,6 +116,8 @@ class RPSComponent(ComponentModel):
         self.eventhandlers[RPSEventTypes.START] = self.on_start
         self.eventhandlers[RPSEventTypes.TRAIN] = self.on_train
         self.eventhandlers[RPSEventTypes.SHARE] = self.on_share
+        self.batchhandlers[RPSEventTypes.SHARE] = self.on_share_batch
+        self.batchsize = SHARE_BATCH_SIZE
 
         self.mst: nx.Graph = None
         self.rpsStarted = False
@@ -136,14 +157,31 @@ class RPSComponent(ComponentModel):
             trainEvent = Event(self, RPSEventTypes.TRAIN, trainEventContent)
             self.send_self(trainEvent)
 
+    def createModel(self):
+        self.model = Sequential()
+        self.model.add(Dense(16, input_dim=self.trainingFeatures.shape[1], activation='relu'))
+        self.model.add(Dense(12, activation='relu'))
+        self.model.add(Dense(8, activation='relu'))
+        self.model.add(Dense(1, activation='sigmoid'))
+        self.model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+
+    # The model is saved in checkpoints by its weights, the optimizer starts afresh when it is restored
+    def get_state(self):
+        state = super().get_state()
+        state['model'] = None if self.model is None else self.model.get_weights()
+        return state
+
+    def set_state(self, state):
+        weights = state.pop('model')
+        super().set_state(state)
+        self.model = None
+        if weights is not None:
+            self.createModel()
+            self.model.set_weights(weights)
+
     def on_train(self, eventobj: Event):
         if self.model is None:
-            self.model = Sequential()
-            self.model.add(Dense(16, input_dim=self.trainingFeatures.shape[1], activation='relu'))
-            self.model.add(Dense(12, activation='relu'))
-            self.model.add(Dense(8, activation='relu'))
-            self.model.add(Dense(1, activation='sigmoid'))
-            self.model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+            self.createModel()
 
         if WEIGHT_AVERAGING:
             receivedWeights = self.receivedWeights
@@ -173,17 +211,13 @@ class RPSComponent(ComponentModel):
                   f"Best Accuracy = %.2f ({self.bestModelInfo['bestModelTrainingRound']})"
                   % (accuracy, self.bestModelInfo['bestModelAccuracy']))
 
-            while GLOBAL_LOCK.locked():
-                continue
-            GLOBAL_LOCK.acquire()
             if WEIGHT_AVERAGING:
                 filePath = AGGREGATED_OUTPUT_FILE_PATH
             else:
                 filePath = OUTPUT_FILE_PATH
-            with open(filePath, 'a+') as f:
-                f.write(f"{self.bestModelInfo['bestModelAccuracy']}\n")
-                f.close()
-            GLOBAL_LOCK.release()
+            with GLOBAL_LOCK:
+                with open(filePath, 'a+') as f:
+                    f.write(f"{self.bestModelInfo['bestModelAccuracy']}\n")
 
     def on_share(self, eventobj: Event):
         messagefrom = eventobj.eventcontent.header.messagefrom
@@ -196,6 +230,15 @@ class RPSComponent(ComponentModel):
             self.receivedWeights[source] = weights
             self.sendWeights(weights, source, messagefrom)
 
+    # Averaging only uses the latest weights of every source, so they are stored before the batch is forwarded
+    def on_share_batch(self, eventobjs):
+        shares = [(eventobj.eventcontent.header.messagefrom, eventobj.eventcontent.payload) for eventobj in eventobjs
+                  if eventobj.eventcontent.payload.source != -1]
+        for _, payload in shares:
+            self.receivedWeights[payload.source] = payload.messagepayload
+        for messagefrom, payload in shares:
+            self.sendWeights(payload.messagepayload, payload.source, messagefrom)
+
     def sendWeights(self, weights, source, messagefrom=-1):
         for n in self.mst.neighbors(self.componentinstancenumber):
             if n != messagefrom:
@@ -1,10 +1,15 @@
+import argparse
 from enum import Enum
 import matplotlib.pyplot as plt
 import networkx as nx
 import random
 import time
+from keras.utils import set_random_seed
 
-from Ahc.Ahc import Topology
+from Ahc.Ahc import SimulationContext, Topology
+from Ahc.Checkpoint import load_checkpoint_graph, save_checkpoint
+from Ahc.Executors import DiscreteEventExecutor, ThreadExecutor
+from Ahc.Replay import EventLog, ReplayExecutor
 from NodeChannel import NodeChannel
 from Node import Node
 from Utility import drawGraph, getPathInMST
@@ -14,6 +19,7 @@ class commands(Enum):
     NEIGHBORS = "neighbor"      # "neighbors"
     MST = "mst"                 # "mst"
     SHOW = "show"               # "show"
+    CHECKPOINT = "checkpoint"   # "checkpoint"
     HELP = "help"               # "help"
 
 class arguments(Enum):
@@ -30,6 +36,7 @@ class arguments(Enum):
     LMST = "-localmst"          # "-localmst"
     LMST_PATH = "-path"         # "-path"
     ACCURACY = "-accuracy"      # "-accuracy"
+    STATS = "-stats"            # "-stats"
 
 lastLocalMSTUpdatedNode = -1
 localMSTManualMode = False
@@ -58,10 +65,17 @@ def helpUserCommand(cmd: commands):
               f"\t\"{commands.SHOW.value} {arguments.LMST_PATH.value} sourceNodeId destinationNodeId\"")
         print(f"Show Best Model's Accuracy:\n"
               f"\t\"{commands.SHOW.value} {arguments.ACCURACY.value} nodeId\"")
+        print(f"Show Busiest Components' Latencies and Queue Depths (collected with --stats):\n"
+              f"\t\"{commands.SHOW.value} {arguments.STATS.value}\"\n"
+              f"\t\"{commands.SHOW.value} {arguments.STATS.value} componentCount\"")
+    elif cmd is commands.CHECKPOINT:
+        print(f"Save Simulation Checkpoint (resume with --resume filePath):\n"
+              f"\t\"{commands.CHECKPOINT.value} filePath\"")
     elif cmd is commands.HELP:
         helpUserCommand(commands.NEIGHBORS)
         helpUserCommand(commands.MST)
         helpUserCommand(commands.SHOW)
+        helpUserCommand(commands.CHECKPOINT)
 
 def neighborsCommand(args: arguments, topology: Topology):
     includeWeights = arguments.WEIGHTS.value in args
@@ -115,7 +129,7 @@ def mstCommand(args: arguments, topology: Topology):
 
             if len(args) == 0:
                 try:
-                    randomNodeId = random.randint(0, len(topology.nodes) - 1)
+                    randomNodeId = topology.context.random.randint(0, len(topology.nodes) - 1)
                     randomNode = topology.nodes.get(randomNodeId)
                 except KeyError:
                     print(f"Node {randomNodeId} does not exist in the topology.")
@@ -272,9 +286,33 @@ def showCommand(args: arguments, topology: Topology):
             print(f"Node {nodeId}'s best accuracy is {accuracy} which is obtained in training round {trainingRound}.")
         else:
             helpUserCommand(commands.SHOW)
+    elif arguments.STATS.value in args:
+        args.remove(arguments.STATS.value)
+
+        if len(args) <= 1:
+            try:
+                limit = int(args[0]) if args else None
+            except ValueError:
+                print(f"\'{args[0]}\' is not integer.")
+                return
+            if not topology.context.metricsenabled:
+                print("Metrics are off, start with --stats to collect them.")
+                return
+            topology.context.registry.print_metrics(limit)
+        else:
+            helpUserCommand(commands.SHOW)
     else:
         helpUserCommand(commands.SHOW)
 
+def checkpointCommand(args: arguments, topology: Topology):
+    if len(args) == 1:
+        if not topology.context.wait_until_quiescent(0):
+            print("Events are being handled, the checkpoint may be inconsistent.")
+        save_checkpoint(args[0], topology.context)
+        print(f"Checkpoint is saved to {args[0]}.")
+    else:
+        helpUserCommand(commands.CHECKPOINT)
+
 def processUserCommand(userInput: str, topology: Topology):
     splitInput = userInput.split(" ")
     cmd = splitInput[0]
@@ -288,12 +326,55 @@ def processUserCommand(userInput: str, topology: Topology):
         mstCommand(args, topology)
     elif cmd == commands.SHOW.value:
         showCommand(args, topology)
+    elif cmd == commands.CHECKPOINT.value:
+        checkpointCommand(args, topology)
     elif cmd == commands.HELP.value:
         helpUserCommand(commands.HELP)
     else:
         print(f"Unknown input: \'{userInput}\'")
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, help="runs deterministically on the discrete event executor")
+    parser.add_argument("--record", help="saves the handled events and the user commands to the file on exit")
+    parser.add_argument("--replay", help="replays a recorded run")
+    parser.add_argument("--resume", help="continues from a checkpoint")
+    parser.add_argument("--latency", type=float, default=0.0, help="the propagation latency of the links in seconds")
+    parser.add_argument("--bandwidth", type=float, help="the bandwidth of the links in bytes per second")
+    parser.add_argument("--coalesce", type=float, default=0.0,
+                        help="bundles the messages sent over a link within the window in seconds")
+    parser.add_argument("--stats", action="store_true", help="collects the metrics that 'show -stats' prints")
+    options = parser.parse_args()
+    NodeChannel.latency = options.latency
+    NodeChannel.coalescewindow = options.coalesce
+    if options.bandwidth is not None:
+        NodeChannel.bandwidth = options.bandwidth
+
+    # A recorded run is seeded even if it runs on threads, the topology and the random numbers have to be the same
+    # when it is replayed
+    eventLog = None
+    deterministic = options.replay is not None or options.seed is not None
+    if options.replay is not None:
+        eventLog = EventLog.load(options.replay)
+        seed = eventLog.seed
+        executor = ReplayExecutor(eventLog)
+    elif options.resume is not None:
+        seed, G = load_checkpoint_graph(options.resume)
+        executor = DiscreteEventExecutor() if options.seed is not None else ThreadExecutor()
+    elif options.seed is not None:
+        seed = options.seed
+        executor = DiscreteEventExecutor()
+    else:
+        seed = random.randrange(2 ** 32) if options.record else None
+        executor = ThreadExecutor()
+    context = SimulationContext(executor, seed)
+    context.activate()
+    if seed is not None:
+        set_random_seed(seed)  # the initial weights of the models
+    if options.record is not None:
+        eventLog = EventLog(seed)
+        eventLog.attach(context)
+
     # G: nx.Graph= nx.random_geometric_graph(5, 0.5, seed=3)
     # G: nx.Graph = nx.random_geometric_graph(14, 0.4, seed=1)
     # G: nx.Graph = nx.random_geometric_graph(15, 0.4, seed=3)
@@ -301,19 +382,46 @@ def main():
     # G: nx.Graph = nx.random_geometric_graph(10, 0.5, seed=3)
     # G: nx.Graph = nx.random_geometric_graph(30, 0.35, seed=3)
     # G: nx.Graph = nx.random_geometric_graph(6, 0.6, seed=3)
-    G: nx.Graph = nx.random_geometric_graph(40, 0.25)
-    for (u, v) in G.edges:
-        G.get_edge_data(u, v)['weight'] = random.randint(1, len(G.nodes))   # u + v + u * v # TODO
+    if options.resume is None:
+        G: nx.Graph = nx.random_geometric_graph(40, 0.25, seed=seed)
+        for (u, v) in G.edges:
+            G.get_edge_data(u, v)['weight'] = context.random.randint(1, len(G.nodes))   # u + v + u * v # TODO
 
     topo = Topology()
+    if options.stats:
+        topo.context.registry.enable_metrics()
     topo.construct_from_graph(G, Node, NodeChannel)
-    topo.start()
+    if options.resume is not None:
+        topo.resume(options.resume)
+    else:
+        topo.start()
+
+    if options.replay is not None:
+        for position, userInput in eventLog.inputs:
+            executor.run_to(position)
+            print(f"\nUser Command:\n{userInput}")
+            processUserCommand(userInput, topo)
+        executor.run()
+        print(f"Replayed {executor.position} of {len(eventLog.records)} recorded events.")
+        return
+    if deterministic:
+        context.wait_until_quiescent()
 
     drawGraph(G, isTopologyGraph=True)
 
-    while True:
-        userInput = input("\nUser Command:\n")
-        processUserCommand(userInput, topo)
+    try:
+        while True:
+            userInput = input("\nUser Command:\n")
+            if options.record is not None:
+                eventLog.record_input(userInput)
+            processUserCommand(userInput, topo)
+            if deterministic:
+                context.wait_until_quiescent()  # runs the events of the command
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if options.record is not None:
+            eventLog.save(options.record)
 
 if __name__ == "__main__":
     main()